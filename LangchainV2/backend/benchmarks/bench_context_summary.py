@@ -0,0 +1,90 @@
+# bench_context_summary.py
+# Micro-benchmark of the context summary builder against the previous
+# row-by-row implementation.
+#
+#   python benchmarks/bench_context_summary.py --rows 10000 --repeat 5
+import argparse
+import os
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.context_summary import build_context_summary
+
+def legacy_context_summary(df: pd.DataFrame):
+    # The SQLNaturaLanguage.__generate_context_summary body this module replaced
+    if df.empty:
+        return ""
+
+    summary_parts = [f"Total records: {len(df)}"]
+    id_col = "po_id" if "po_id" in df.columns else "purchase_order_id" if "purchase_order_id" in df.columns else None
+
+    if id_col:
+        for po_id in df[id_col].unique()[:50]:
+            po_data = df[df[id_col] == po_id].iloc[0]
+            po_summary = [f"For Purchase Order ID: {po_id}"]
+            formatted_row = [
+                f"  {col.replace('_', ' ').title()}: "
+                f"{pd.Timestamp(po_data[col]).strftime('%Y-%m-%d') if pd.notnull(po_data[col]) else 'null'}"
+                if "date" in col.lower()
+                else f"  {col.replace('_', ' ').title()}: {f'{po_data[col]:,.2f}'.replace(',', ',') if pd.notnull(po_data[col]) else 'null'}"
+                if df[col].dtype in ["int64", "float64"]
+                else f"  {col.replace('_', ' ').title()}: {po_data[col] if pd.notnull(po_data[col]) else 'null'}"
+                for col in df.columns
+            ]
+            po_summary.extend(formatted_row)
+            summary_parts.append("\n".join(po_summary))
+    else:
+        max_rows = 50
+        for idx, row in df.head(max_rows).iterrows():
+            formatted_row = [
+                f"{col.replace('_', ' ').title()}: "
+                f"{pd.Timestamp(row[col]).strftime('%Y-%m-%d') if pd.notnull(row[col]) else 'null'}"
+                if "date" in col.lower()
+                else f"{col.replace('_', ' ').title()}: {f'{row[col]:,.2f}'.replace(',', ',') if pd.notnull(row[col]) else 'null'}"
+                if df[col].dtype in ["int64", "float64"]
+                else f"{col.replace('_', ' ').title()}: {row[col] if pd.notnull(row[col]) else 'null'}"
+                for col in df.columns
+            ]
+            summary_parts.append(f"Row {idx+1}: {', '.join(formatted_row)}")
+        if len(df) > max_rows:
+            summary_parts.append(f"... (showing first {max_rows} of {len(df)} rows)")
+
+    return "\n".join(summary_parts)
+
+def make_frame(rows, with_po=True, extra_columns=10, seed=7):
+    # Purchase-order shaped frame: several item rows per PO, dates as strings
+    # (as stored in upeg), amounts, free text and some nulls.
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "po_id": rng.integers(100000, 100000 + max(rows // 4, 1), size=rows),
+        "po_creation_date": pd.Series(pd.date_range("2023-01-01", periods=rows, freq="h")).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "po_price_total": rng.uniform(1_000, 50_000_000, size=rows).round(2),
+        "buyer_name": rng.choice(["Asha Rao", "Vikram Shah", None, "Meera Iyer"], size=rows),
+        "delivery_date": pd.date_range("2023-02-01", periods=rows, freq="h"),
+        "quantity": rng.integers(1, 5000, size=rows),
+    })
+    for i in range(extra_columns):
+        df[f"item_attribute_{i}"] = rng.choice(["A", "B", "C", None], size=rows)
+    if not with_po:
+        df = df.drop(columns=["po_id"])
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Context summary micro-benchmark")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, with_po in (("PO grouped", True), ("row based", False)):
+        df = make_frame(args.rows, with_po=with_po)
+        legacy = min(timeit.repeat(lambda: legacy_context_summary(df), number=1, repeat=args.repeat))
+        vectorized = min(timeit.repeat(lambda: build_context_summary(df), number=1, repeat=args.repeat))
+        print(f"{label:<11} rows={args.rows:<8} legacy={legacy * 1000:9.2f} ms  "
+              f"vectorized={vectorized * 1000:9.2f} ms  speedup={legacy / vectorized:6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# bench_e2e.py
+# Offline end-to-end benchmark of POST /query: Gemini is replaced by a fake
+# chat model with fixed latency and canned SQL, and Postgres by a local
+# SQLite file. Requests go through the real FastAPI app (lifespan, session
+# middleware, serialization) from a pool of concurrent virtual users.
+#
+#   python benchmarks/bench_e2e.py --dataset synthetic --rows 1000000 --requests 500 --concurrency 50
+#
+# Needs aiosqlite for the async engine (pip install aiosqlite).
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.seed_db import MARKETING_DB, SYNTHETIC_DB, WORKLOADS, seed_synthetic
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss():
+    # Bytes; falls back to the process peak where /proc is not available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# Records every STAGE_SECONDS observation with its time window, and samples
+# RSS in the background so each stage can report the peak seen while it ran.
+class StageRecorder:
+    def __init__(self, histogram, interval=0.005):
+        self.histogram = histogram
+        self.interval = interval
+        self.stages = []  # (stage, started, ended, rss at end)
+        self.samples = []  # (time, rss)
+        self._observe = histogram.observe
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def start(self):
+        self.histogram.observe = self.__observe
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.histogram.observe = self._observe
+        self.sample_times = np.array([sample[0] for sample in self.samples])
+        self.sample_rss = np.array([sample[1] for sample in self.samples])
+
+    def peak_rss(self, started, ended, rss_at_end):
+        # Only valid after stop()
+        low, high = np.searchsorted(self.sample_times, [started, ended])
+        return max(rss_at_end, self.sample_rss[low:high].max()) if high > low else rss_at_end
+
+    def __observe(self, value, **labels):
+        ended = time.perf_counter()
+        self.stages.append((labels.get("stage", ""), ended - value, ended, current_rss()))
+        self._observe(value, **labels)
+
+    def __sample(self):
+        while not self._stop.is_set():
+            self.samples.append((time.perf_counter(), current_rss()))
+            time.sleep(self.interval)
+
+def configure_environment(args):
+    # Must run before the app is imported: settings are read at import time
+    if args.dataset == "synthetic":
+        path = seed_synthetic(args.db_path or SYNTHETIC_DB, args.rows)
+    else:
+        path = args.db_path or MARKETING_DB
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ["INCLUDED_TABLES"] = ",".join(WORKLOADS[args.dataset]["tables"])
+    os.environ["GOOGLE_API_KEY"] = "offline-benchmark"
+    os.environ["SQL_CACHE_ENABLED"] = "false" if args.no_sql_cache else "true"
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("RESULT_STORE_DIR", tempfile.mkdtemp(prefix="nlp2sql_bench_"))
+    return path
+
+def install_fake_llm(args):
+    import src.generative_ai as generative_ai
+    from benchmarks.fake_llm import FakeChatModel
+
+    workload = WORKLOADS[args.dataset]
+    generative_ai.ChatGoogleGenerativeAI = lambda **kwargs: FakeChatModel(
+        canned_sql=workload["queries"],
+        default_sql=next(iter(workload["queries"].values())),
+        sql_latency=args.sql_latency,
+        summary_latency=args.summary_latency
+    )
+
+async def virtual_user(app, questions, counter, total, latencies, errors, fresh_session):
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        while True:
+            index = next(counter)
+            if index >= total:
+                return
+            if fresh_session:
+                client.cookies.clear()
+            started = time.perf_counter()
+            response = await client.post("/query", json={"question": questions[index % len(questions)]})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200 or response.json().get("error"):
+                errors.append(response.text[:200])
+
+async def run_load(args, app, lifespan):
+    import itertools
+
+    questions = list(WORKLOADS[args.dataset]["queries"])
+    counter = itertools.count()
+    latencies, errors = [], []
+    async with lifespan(app):
+        # Warm-up request so the first measured one does not pay for imports
+        await virtual_user(app, questions, itertools.count(), 1, [], [], True)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(app, questions, counter, args.requests, latencies, errors, args.fresh_session)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed, started
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return f"{p50:9.1f} {p95:9.1f} {p99:9.1f}"
+
+def report(args, latencies, errors, elapsed, started, recorder):
+    print(f"dataset={args.dataset} requests={len(latencies)} concurrency={args.concurrency} "
+          f"sql_latency={args.sql_latency}s summary_latency={args.summary_latency}s sql_cache={not args.no_sql_cache}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s over {elapsed:.2f}s, errors: {len(errors)}")
+    for error in errors[:3]:
+        print("  error:", error)
+
+    print(f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    print(f"{'client':<16} {len(latencies):>6} {percentiles(latencies)} {recorder.sample_rss.max() / 2**20:12.1f}")
+    by_stage = {}
+    for stage, stage_started, ended, rss in recorder.stages:
+        if stage_started >= started:
+            by_stage.setdefault(stage, []).append((ended - stage_started, recorder.peak_rss(stage_started, ended, rss)))
+    for stage, observations in sorted(by_stage.items()):
+        durations = [duration for duration, _ in observations]
+        peak = max(rss for _, rss in observations)
+        print(f"{stage:<16} {len(observations):>6} {percentiles(durations)} {peak / 2**20:12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of POST /query")
+    parser.add_argument("--dataset", choices=sorted(WORKLOADS), default="marketing")
+    parser.add_argument("--rows", type=int, default=10000, help="Item rows for the synthetic dataset")
+    parser.add_argument("--db-path", help="Use this SQLite file instead of the default location")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sql-latency", type=float, default=0.8, help="Seconds per fake SQL-generation call")
+    parser.add_argument("--summary-latency", type=float, default=1.5, help="Seconds per fake summary call")
+    parser.add_argument("--no-sql-cache", action="store_true", help="Disable the SQL translation cache")
+    parser.add_argument("--fresh-session", action="store_true", help="Drop the session cookie before every request")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    install_fake_llm(args)
+    from src.metrics import STAGE_SECONDS
+    import main as api
+
+    recorder = StageRecorder(STAGE_SECONDS)
+    recorder.start()
+    try:
+        latencies, errors, elapsed, started = asyncio.run(run_load(args, api.app, api.lifespan))
+    finally:
+        recorder.stop()
+    report(args, latencies, errors, elapsed, started, recorder)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# fake_llm.py
+# Deterministic stand-in for ChatGoogleGenerativeAI used by the offline
+# benchmarks: fixed latency per call and canned SQL picked by question.
+import asyncio
+import time
+from typing import Dict
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+SUMMARY_MARKER = "procurement data analyst"  # Only the summary prompt contains it
+
+class FakeChatModel(BaseChatModel):
+    # question text -> SQL; the first question found in the prompt wins
+    canned_sql: Dict[str, str]
+    default_sql: str
+    sql_latency: float = 0.8  # seconds, roughly a Gemini SQL-generation call
+    summary_latency: float = 1.5
+    summary_text: str = "**Summary** of the matching procurement records.\n\n* Rows: see the table below."
+    stream_chunks: int = 20
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = messages[-1].content
+        time.sleep(self.__latency(text))
+        return self.__result(text)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = messages[-1].content
+        await asyncio.sleep(self.__latency(text))
+        return self.__result(text)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = messages[-1].content
+        pieces = self.__pieces(text)
+        for piece in pieces:
+            time.sleep(self.__latency(text) / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = messages[-1].content
+        pieces = self.__pieces(text)
+        for piece in pieces:
+            await asyncio.sleep(self.__latency(text) / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    def answer(self, text):
+        if SUMMARY_MARKER in text:
+            return self.summary_text
+        for question, query_sql in self.canned_sql.items():
+            if question in text:
+                return f"SQLQuery: {query_sql}"
+        return f"SQLQuery: {self.default_sql}"
+
+    def __latency(self, text):
+        return self.summary_latency if SUMMARY_MARKER in text else self.sql_latency
+
+    def __result(self, text):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer(text)))])
+
+    def __pieces(self, text):
+        answer = self.answer(text)
+        size = max(1, len(answer) // self.stream_chunks)
+        return [answer[i:i + size] for i in range(0, len(answer), size)]
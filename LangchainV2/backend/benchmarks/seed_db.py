@@ -0,0 +1,106 @@
+# seed_db.py
+# Local stand-ins for the upeg Postgres used by the offline benchmarks: the
+# shipped marketing.db, or a synthetic purchase_order_* dataset in SQLite.
+#
+#   python benchmarks/seed_db.py --rows 1000000
+import argparse
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKETING_DB = os.path.join(BACKEND_DIR, "data", "marketing.db")
+SYNTHETIC_DB = os.path.join(tempfile.gettempdir(), "nlp2sql_purchase_orders.db")
+
+ITEMS_PER_ORDER = 4
+VENDORS = ["Tata Steel", "Larsen & Toubro", "Bharat Forge", "Asian Paints", "Finolex Cables", "Havells", "Kirloskar", "Thermax"]
+BUYERS = ["Anita Rao", "Vikram Shah", "Priya Nair", "Rahul Mehta", "Sunita Iyer"]
+STATUSES = ["Open", "Approved", "Closed", "Cancelled"]
+ITEMS = ["Steel Plate", "Copper Cable", "Valve Assembly", "Bearing", "Paint Drum", "Pump Motor", "Gasket Kit", "Switchgear"]
+
+# Question -> SQL the fake model answers with. Questions cover the summary
+# paths: small results (rule-based), large ones (LLM, spilled pages) and
+# "risk"/"trend" questions that always go to the LLM.
+WORKLOADS = {
+    "marketing": {
+        "tables": ["client", "data_predict"],
+        "queries": {
+            "Show the five oldest customers": "SELECT ID, Year_Birth, Marital_Status FROM client ORDER BY Year_Birth LIMIT 5",
+            "List all married customers": "SELECT ID, Year_Birth, Dt_Customer, email FROM client WHERE Marital_Status = 'Married'",
+            "Average income by education": "SELECT Education, AVG(Income) AS avg_income, COUNT(*) AS customers FROM data_predict GROUP BY Education",
+            "Which customers are at risk of churn": "SELECT ID, Recency, Complain, prediction_label, prediction_score_1 FROM data_predict WHERE prediction_label = 1",
+        },
+    },
+    "synthetic": {
+        "tables": ["purchase_order_main", "purchase_order_item"],
+        "queries": {
+            "Show the five latest purchase orders": "SELECT po_id, po_number, buyer_name, po_date, po_price_total FROM purchase_order_main ORDER BY po_id DESC LIMIT 5",
+            "List open purchase orders with their totals": "SELECT po_id, po_number, vendor_name, po_date, po_price_total FROM purchase_order_main WHERE status = 'Open'",
+            "Total spend per vendor": "SELECT vendor_name, SUM(po_price_total) AS total_spend, COUNT(*) AS orders FROM purchase_order_main GROUP BY vendor_name",
+            "Which orders are at risk of delay": (
+                "SELECT purchase_order_id, item_id, item_name, quantity, delivery_date, delivery_address FROM purchase_order_item "
+                "WHERE delivery_address IS NOT NULL AND quantity > 90 LIMIT 200"
+            ),
+        },
+    },
+}
+
+def synthetic_frames(rows, seed=7):
+    # rows is the number of item rows; purchase orders carry ITEMS_PER_ORDER items each
+    rng = np.random.default_rng(seed)
+    orders = max(1, rows // ITEMS_PER_ORDER)
+    po_ids = np.arange(1, orders + 1)
+    po_dates = pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 1000, orders), unit="D")
+    main = pd.DataFrame({
+        "po_id": po_ids,
+        "po_number": [f"PO-{po_id:08d}" for po_id in po_ids],
+        "vendor_name": rng.choice(VENDORS, orders),
+        "buyer_name": rng.choice(BUYERS, orders),
+        "status": rng.choice(STATUSES, orders, p=[0.3, 0.3, 0.3, 0.1]),
+        "po_date": po_dates.strftime("%d-%m-%Y"),  # Dates are strings in upeg
+        "po_price_total": rng.gamma(2.0, 150000.0, orders).round(2),
+    })
+    order_of_item = rng.choice(po_ids, rows)
+    item = pd.DataFrame({
+        "item_id": np.arange(1, rows + 1),
+        "purchase_order_id": order_of_item,
+        "item_name": rng.choice(ITEMS, rows),
+        "quantity": rng.integers(1, 100, rows),
+        "unit_price": rng.gamma(2.0, 2500.0, rows).round(2),
+        "delivery_date": (pd.Timestamp("2022-02-01") + pd.to_timedelta(rng.integers(0, 1100, rows), unit="D")).strftime("%d-%m-%Y"),
+        "delivery_address": np.where(rng.random(rows) < 0.2, None, rng.choice(["Pune Plant", "Chennai Depot", "Vadodara Yard"], rows)),
+    })
+    return main, item
+
+def seed_synthetic(path, rows, seed=7):
+    # Rebuilt only when missing or seeded with a different size
+    marker = f"{rows}:{seed}"
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            try:
+                if conn.execute("SELECT value FROM seed_info WHERE key = 'rows'").fetchone() == (marker,):
+                    return path
+            except sqlite3.Error:
+                pass
+        os.remove(path)
+    main, item = synthetic_frames(rows, seed)
+    with sqlite3.connect(path) as conn:
+        main.to_sql("purchase_order_main", conn, index=False, chunksize=50000)
+        item.to_sql("purchase_order_item", conn, index=False, chunksize=50000)
+        conn.execute("CREATE INDEX ix_item_po ON purchase_order_item (purchase_order_id)")
+        conn.execute("CREATE TABLE seed_info (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT INTO seed_info VALUES ('rows', ?)", (marker,))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the synthetic purchase order SQLite database")
+    parser.add_argument("--rows", type=int, default=10000, help="Item rows to generate")
+    parser.add_argument("--path", default=SYNTHETIC_DB)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print("Seeded", seed_synthetic(args.path, args.rows, args.seed))
+
+if __name__ == "__main__":
+    main()
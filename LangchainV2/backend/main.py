@@ -1,17 +1,83 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from starlette.middleware.sessions import SessionMiddleware
-from src.backend_core import QueryExecutor
+from src.backend_core import QueryExecutor, get_agent, shutdown_agents
 import uvicorn
-import pandas as pd
 import uuid
-from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import os
+import logging
+import time
+import secrets
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 import asyncio
-from src.generative_ai import PROMPT
+from src.generative_ai import PROMPT, is_follow_up
+from src.context_summary import build_context_entry, render_context_entries
+from src.session_store import create_session_store
+from src.analytics_replica import REPLICA_ENABLED, REPLICA_REFRESH_INTERVAL
+from src.sql_cache import normalize_question
+from src.result_store import ResultStore, RESULT_PAGE_SIZE, RESULT_STORE_CLEANUP_INTERVAL, encode_cursor, decode_cursor
+from src.serializers import (
+    ARROW, ARROW_MEDIA_TYPE, COLUMNAR, COLUMNAR_MEDIA_TYPE, JSON_MEDIA_TYPE,
+    dumps, negotiate_format, serialize_data, to_arrow_stream, to_records
+)
+from src.metrics import timed, render_metrics, STAGE_SECONDS, REQUESTS
+from src.request_log import sampled
+
+logger = logging.getLogger("nlp2sql.api")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+result_store = ResultStore()
+session_store = create_session_store()
+
+async def cleanup_stores():
+    while True:
+        await asyncio.sleep(RESULT_STORE_CLEANUP_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(result_store.cleanup)
+            if removed:
+                logger.info("Expired result pages removed: %s", removed)
+        except Exception as error:
+            logger.warning("Result store cleanup failed: %s", error)
+        try:
+            removed = await asyncio.to_thread(session_store.cleanup)
+            if removed:
+                logger.info("Expired sessions removed: %s", removed)
+        except Exception as error:
+            logger.warning("Session store cleanup failed: %s", error)
 
-app = FastAPI()
+async def refresh_replica():
+    # Every worker runs the loop; the replica's file lock lets one refresh at a
+    # time and tables refreshed within the interval by another worker are skipped
+    while True:
+        try:
+            failed = await asyncio.to_thread(QueryExecutor().refresh_replica)
+            if failed:
+                logger.warning("Analytics replica refresh failed for: %s", ", ".join(failed))
+            elif failed is not None:
+                logger.info("Analytics replica refreshed")
+        except Exception as error:
+            logger.warning("Analytics replica refresh failed: %s", error)
+        await asyncio.sleep(REPLICA_REFRESH_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared agent once per worker so the first request does not pay
+    # for engine creation, schema reflection and LLM client setup.
+    await asyncio.to_thread(get_agent)
+    background_tasks = [asyncio.create_task(cleanup_stores())]
+    if REPLICA_ENABLED:
+        background_tasks.append(asyncio.create_task(refresh_replica()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await shutdown_agents()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -25,79 +91,279 @@ app.add_middleware(
 # Session middleware
 app.add_middleware(SessionMiddleware, secret_key="<Random Secret key for session>", session_cookie="procurement_session", max_age=86400)
 
-# Thread pool for running synchronous tasks
-executor = ThreadPoolExecutor(max_workers=10)  # Adjust based on load
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
 
 class QueryRequest(BaseModel):
     question: str
 
-async def run_in_thread(sync_func, *args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, lambda: sync_func(*args, **kwargs))
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+
+class TemplateRequest(BaseModel):
+    pattern: str
+    sql: str
+    formats: Optional[Dict[str, str]] = None
+
+def require_admin(request: Request):
+    # Fails closed: without ADMIN_TOKEN the admin endpoints are disabled
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not secrets.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def session_id(request: Request):
+    # The cookie only carries the session id; the context lives in session_store
+    session = request.session
+    if "session_id" not in session:
+        session["session_id"] = str(uuid.uuid4())
+    session.pop("context", None)  # Left over from cookie-held sessions
+    return session["session_id"]
+
+async def load_context(session_id, question):
+    # Stored entries are only read and expanded for follow-up questions
+    if not is_follow_up(question):
+        return None
+    entries = await asyncio.to_thread(session_store.get, session_id)
+    return render_context_entries(entries) or None
+
+async def save_context(session_id, question, query_df):
+    entry = build_context_entry(query_df, question)
+    await asyncio.to_thread(session_store.append, session_id, entry)
+    return entry
+
+def render_data(data_format, payload, frame):
+    with timed("serialization"):
+        return serialize_response(data_format, payload, frame)
+
+def serialize_response(data_format, payload, frame):
+    if data_format == ARROW:
+        return Response(content=to_arrow_stream(frame, metadata={k: v for k, v in payload.items() if k != "data"}), media_type=ARROW_MEDIA_TYPE)
+    payload["data"] = serialize_data(frame, data_format)
+    return Response(content=dumps(payload), media_type=COLUMNAR_MEDIA_TYPE if data_format == COLUMNAR else JSON_MEDIA_TYPE)
+
+async def data_response(request: Request, payload, frame):
+    # Format is negotiated through Accept (or ?format=records|columnar|arrow);
+    # serialization runs off the event loop since it is CPU-bound on big results.
+    data_format = negotiate_format(request.headers.get("accept"), request.query_params.get("format"))
+    return await asyncio.to_thread(render_data, data_format, payload, frame)
+
+async def result_payload(prompt, result):
+    # Large results are spilled to the result store and only the first page
+    # is returned; later pages come from /query/{query_id}/rows.
+    query_df = result.get("query_df")
+    query_id, next_cursor = None, None
+    if query_df is not None and len(query_df) > RESULT_PAGE_SIZE:
+        query_id = await asyncio.to_thread(result_store.save, query_df)
+        if query_id:
+            query_df = query_df.head(RESULT_PAGE_SIZE)
+            next_cursor = encode_cursor(RESULT_PAGE_SIZE)
+
+    return {
+        "prompt": prompt,
+        "result": result.get("result"),
+        "summary_path": result.get("summary_path"),
+        "data": None,
+        "query_id": query_id,
+        "next_cursor": next_cursor,
+        "row_count": result.get("row_count", 0),
+        "error": result.get("error"),
+        "sql_cache": result.get("sql_cache"),
+        "sql_template": result.get("sql_template"),
+        "sql_guard": result.get("sql_guard"),
+        "backend": result.get("backend"),
+        "prompt_tokens": result.get("prompt_tokens"),
+        "truncated": result.get("truncated", False),
+        "total_count": result.get("total_count")
+    }, query_df
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {dumps(payload).decode('utf-8')}\n\n"
 
 @app.post("/query")
 async def query_handler(request: Request, query: QueryRequest):
-    session = request.session
+    started = time.perf_counter()
     question = query.question
     prompt = PROMPT.format(question=question)
-
-    print("Prompt is", prompt)
-    print("Session is", session)
+    # Detailed logs for a sample of requests only; never the rows themselves
+    detailed = sampled()
 
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty")
 
-    # Ensure a unique session ID exists
-    if "session_id" not in session:
-        session["session_id"] = str(uuid.uuid4())
-        session["context"] = []
+    current_session = session_id(request)
+    context_summary = await load_context(current_session, question)
+
+    query_executor = QueryExecutor()  # Reuses the worker's warm agent
+    # Fully async: LLM and database concurrency are bounded by the agent's semaphores
+    result = await query_executor.aexecute(prompt=prompt, context_summary=context_summary)
+
+    if detailed:
+        logger.info("Question %r: sql_cache=%s sql_template=%r rows=%s summary_path=%s error=%s", question, result.get("sql_cache"),
+                    result.get("sql_template"), result.get("row_count", 0), result.get("summary_path"), result.get("error"))
+
+    # Failed questions leave the context unchanged
+    if result.get("query_df") is not None:
+        entry = await save_context(current_session, question, result["query_df"])
+        if detailed:
+            logger.info("Session %s context entry: %s rows, %s ids", current_session, entry["rows"], len(entry.get("ids", [])))
+
+    payload, query_df = await result_payload(prompt, result)
+    response = await data_response(request, payload, query_df)
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="request")
+    REQUESTS.inc(endpoint="query", outcome="error" if result.get("error") else "ok")
+    return response
+
+@app.get("/query/{query_id}/rows")
+async def query_rows_handler(request: Request, query_id: str, cursor: str):
+    try:
+        offset = decode_cursor(cursor)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    try:
+        page, total_rows = await asyncio.to_thread(result_store.page, query_id, offset, RESULT_PAGE_SIZE)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+
+    next_offset = offset + RESULT_PAGE_SIZE
+    REQUESTS.inc(endpoint="rows", outcome="ok")
+    return await data_response(request, {
+        "query_id": query_id,
+        "data": None,
+        "next_cursor": encode_cursor(next_offset) if next_offset < total_rows else None,
+        "row_count": total_rows
+    }, page)
+
+@app.post("/query/stream")
+async def query_stream_handler(request: Request, query: QueryRequest):
+    question = query.question
+    prompt = PROMPT.format(question=question)
+
+    # The session id is set before the response starts, so the cookie goes
+    # out with the headers; the context itself is saved once the rows are in.
+    current_session = session_id(request)
+    context_summary = await load_context(current_session, question)
+
+    agent = QueryExecutor().agent
 
-    # Retrieve or initialize session context
-    context_summary = "\n\n".join(session.get("context", [])[-4:])
+    async def event_stream():
+        started = time.perf_counter()
+        outcome = "ok"
+        frames = []
+        yield sse_event("prompt", {"prompt": prompt})
+        async for event, payload in agent.aexecution_stream(prompt=prompt, context_summary=context_summary):
+            if event == "rows":
+                frames.append(payload)
+                with timed("serialization"):
+                    payload = to_records(payload)
+            elif event in ("summary", "summary_path"):
+                payload = {"text": payload}
+            elif event == "done":
+                await save_context(current_session, question, pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+            elif event == "error":
+                outcome = "error"
+            yield sse_event(event, payload)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="stream_request")
+        REQUESTS.inc(endpoint="stream", outcome=outcome)
 
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch")
+async def query_batch_handler(query: BatchQueryRequest):
+    # Independent questions (no conversation context), answered as Server-Sent
+    # Events in completion order; each "result" carries its input index.
+    if not query.questions:
+        raise HTTPException(status_code=400, detail="questions cannot be empty")
+    if len(query.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    prompts = [PROMPT.format(question=question) for question in query.questions]
     query_executor = QueryExecutor()
-    # Run synchronous execute in a separate thread
-    result = await run_in_thread(query_executor.execute, prompt=prompt, context_summary=context_summary)
 
-    # Log the result for debugging
-    print("QueryExecutor result:", result)
+    async def event_stream():
+        started = time.perf_counter()
+        errors = 0
+        yield sse_event("batch", {"count": len(prompts), "unique": len(set(map(normalize_question, prompts)))})
+        async for index, result in query_executor.abatch_stream(prompts):
+            payload, query_df = await result_payload(prompts[index], result)
+            payload["index"] = index
+            payload["question"] = query.questions[index]
+            del payload["prompt"]
+            with timed("serialization"):
+                payload["data"] = to_records(query_df)
+            errors += bool(result.get("error"))
+            yield sse_event("result", payload)
+        yield sse_event("done", {"count": len(prompts), "errors": errors})
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="batch_request")
+        REQUESTS.inc(endpoint="batch", outcome="error" if errors else "ok")
 
-    # Update session context with a fallback if context_summary is missing or empty
-    if "context_summary" in result and result["context_summary"]:
-        session["context"] = session.get("context", []) + [result["context_summary"]]
-    else:
-        # Fallback: Create a basic context summary from result to ensure history is stored
-        po_ids = []
-        if result.get("query_df") is not None and not result["query_df"].empty:
-            po_ids = result["query_df"].get("po_id", []).tolist()
-        fallback_summary = f"Query: {question}\nPO IDs: {', '.join(map(str, po_ids)) if po_ids else 'None'}\nResult: {result.get('result', 'No result')}"
-        session["context"] = session.get("context", []) + [fallback_summary]
-    session["context"] = session["context"][-4:]  # Keep last 4 entries
-
-    # Log the updated context for debugging
-    print("Updated session context:", session["context"])
-
-    # Convert DataFrame to JSON-serializable format
-    data = result.get("query_df")
-    if data is not None and not data.empty:
-        for col in data.select_dtypes(include=['datetime64[ns]', 'datetime64[ns, UTC]']).columns:
-            data[col] = data[col].apply(lambda x: x.isoformat() if pd.notnull(x) else None)
-        data = data.to_dict(orient="records")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/admin/refresh-schema")
+async def refresh_schema(request: Request):
+    require_admin(request)
+    tables = await asyncio.to_thread(QueryExecutor().refresh_schema)
+    return {"message": "Schema refreshed", "tables": tables}
+
+@app.get("/admin/cache-stats")
+async def cache_stats(request: Request):
+    require_admin(request)
+    return QueryExecutor().cache_stats()
+
+@app.post("/admin/refresh-replica")
+async def refresh_replica_handler(request: Request):
+    require_admin(request)
+    failed = await asyncio.to_thread(QueryExecutor().refresh_replica, True)
+    if failed is None:
+        message = "Replica disabled or refresh already running"
     else:
-        data = []
+        message = "Replica refresh failed for some tables" if failed else "Replica refreshed"
+    return {"message": message, "failed": failed or [],
+            "tables": await asyncio.to_thread(QueryExecutor().replica_status)}
 
-    return JSONResponse(content={
-        "prompt": prompt,
-        "result": result.get("result"),
-        "data": data,
-        "error": result.get("error")
-    })
+@app.get("/admin/replica")
+async def replica_status(request: Request):
+    require_admin(request)
+    return await asyncio.to_thread(QueryExecutor().replica_status)
+
+@app.get("/admin/templates")
+async def list_templates(request: Request):
+    require_admin(request)
+    return await asyncio.to_thread(QueryExecutor().list_templates)
+
+@app.post("/admin/templates")
+async def register_template(request: Request, template: TemplateRequest):
+    require_admin(request)
+    try:
+        registered = await asyncio.to_thread(QueryExecutor().register_template, template.pattern, template.sql, template.formats)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return {"message": "Template registered", "template": registered}
+
+@app.delete("/admin/templates")
+async def remove_template(request: Request, pattern: str):
+    require_admin(request)
+    if not await asyncio.to_thread(QueryExecutor().remove_template, pattern):
+        raise HTTPException(status_code=404, detail="Template not found")
+    return {"message": "Template removed"}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format; each uvicorn worker reports its own series
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.post("/clear-history")
 async def clear_history(request: Request):
-    session = request.session
-    session["context"] = []
-    print("Context cleared for session:", session["session_id"])
+    current_session = session_id(request)
+    await asyncio.to_thread(session_store.clear, current_session)
+    logger.info("Context cleared for session: %s", current_session)
     return {"message": "Context history cleared"}
 
 if __name__ == "__main__":
@@ -0,0 +1,335 @@
+# analytics_replica.py
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlalchemy as sql
+import sqlglot
+from sqlglot import exp
+from src.metrics import timed, REPLICA_QUERIES
+from src.result_fetch import bounded_sql, count_sql
+from src.sql_guard import FORBIDDEN_NODES, SQLGLOT_DIALECTS
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes from several workers are not coordinated
+    fcntl = None
+
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "false").lower() == "true"
+REPLICA_DIR = os.getenv("REPLICA_DIR", os.path.join(tempfile.gettempdir(), "nlp2sql_replica"))
+REPLICA_REFRESH_INTERVAL = int(os.getenv("REPLICA_REFRESH_INTERVAL", "300"))  # seconds between refreshes
+REPLICA_FULL_REFRESH_INTERVAL = int(os.getenv("REPLICA_FULL_REFRESH_INTERVAL", "86400"))  # seconds; rebuilds and picks up deletes
+REPLICA_MAX_STALENESS = int(os.getenv("REPLICA_MAX_STALENESS", "900"))  # seconds; older snapshots are not queried
+REPLICA_FETCH_BATCH = int(os.getenv("REPLICA_FETCH_BATCH", "50000"))  # rows read from the database per chunk
+# Incremental tables, as table:watermark_column[:key_column] separated by
+# commas. Only rows with a newer watermark are copied; with a key column the
+# newest version of each row wins. Other tables are copied in full.
+REPLICA_INCREMENTAL = os.getenv("REPLICA_INCREMENTAL", "")
+
+def parse_incremental(spec):
+    tables = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        parts = entry.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid REPLICA_INCREMENTAL entry: {entry}")
+        tables[parts[0]] = (parts[1], parts[2] if len(parts) == 3 else None)
+    return tables
+
+def is_aggregate(tree):
+    # Read-only queries whose outer SELECT aggregates: few result rows, many
+    # rows scanned, which is what a columnar copy is good at
+    if not isinstance(tree, exp.Select) or tree.find(*FORBIDDEN_NODES) is not None:
+        return False
+    if tree.args.get("group"):
+        return True
+    return any(projection.find(exp.AggFunc) is not None for projection in tree.expressions)
+
+def output_name(projection, dialect):
+    # Column name the database gives an unaliased expression, so answers from
+    # the replica have the same columns (Postgres: "count", SQLite: "COUNT(*)")
+    if dialect != "postgres":
+        return projection.sql(dialect=dialect)
+    if isinstance(projection, exp.Cast):
+        return output_name(projection.this, dialect)
+    if isinstance(projection, exp.Column):
+        return projection.name
+    return projection.sql_name().lower() if isinstance(projection, exp.Func) else "?column?"
+
+# Arrow type by the Python type of a reflected column, most specific first
+ARROW_TYPES = [
+    (bool, pa.bool_()), (int, pa.int64()), (float, pa.float64()), (Decimal, pa.float64()),
+    (datetime, pa.timestamp("ns")), (date, pa.date32()), (str, pa.string()), (bytes, pa.binary())
+]
+
+def arrow_type(column_type):
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return pa.string()
+    return next((arrow for base, arrow in ARROW_TYPES if issubclass(python_type, base)), pa.string())
+
+def watermark_value(value):
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, "item") else value
+
+# Local columnar copy of INCLUDED_TABLES for aggregate questions. Each table is
+# a set of Parquet parts under REPLICA_DIR, exposed to an in-process DuckDB as
+# a view with the same schema and name as in the database, so generated SQL
+# only needs transpiling to the DuckDB dialect. manifest.json records each
+# table's generation, parts, watermark and refresh time; every worker reads it
+# and one worker at a time refreshes.
+class AnalyticsReplica:
+    def __init__(self, tables, schema=None, path=REPLICA_DIR, max_staleness=REPLICA_MAX_STALENESS,
+                 incremental=REPLICA_INCREMENTAL, fetch_batch=REPLICA_FETCH_BATCH,
+                 full_refresh_interval=REPLICA_FULL_REFRESH_INTERVAL, refresh_interval=REPLICA_REFRESH_INTERVAL):
+        import duckdb  # Optional dependency, only needed when the replica is enabled
+
+        self.tables = [table for table in tables if table]
+        self.schema = schema
+        self.path = path
+        self.max_staleness = max_staleness
+        self.incremental = parse_incremental(incremental)
+        self.fetch_batch = fetch_batch
+        self.full_refresh_interval = full_refresh_interval
+        self.refresh_interval = refresh_interval
+        self.duckdb_error = duckdb.Error
+        self._conn = duckdb.connect()
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._generations = {}  # table -> generation the view points at
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        if self.schema:
+            self._conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"')
+
+    def route(self, query_sql, dialect):
+        # DuckDB SQL for a query the replica can answer, or None
+        try:
+            tree = sqlglot.parse_one(query_sql, read=SQLGLOT_DIALECTS.get(dialect))
+        except sqlglot.errors.SqlglotError:
+            return None
+        if not is_aggregate(tree):
+            REPLICA_QUERIES.inc(outcome="skipped")
+            return None
+        ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        tables = [table for table in tree.find_all(exp.Table) if table.name.lower() not in ctes]
+        self.__sync_views()
+        manifest = {name.lower(): entry for name, entry in self._manifest.items()}
+        now = time.time()
+        for table in tables:
+            entry = manifest.get(table.name.lower())
+            if entry is None or now - entry["refreshed_at"] > self.max_staleness:
+                REPLICA_QUERIES.inc(outcome="stale")
+                return None
+            if self.schema and not table.db:
+                table.set("db", exp.to_identifier(self.schema))  # DuckDB cursors do not share a search path
+        read = SQLGLOT_DIALECTS.get(dialect)
+        tree.set("expressions", [
+            projection if isinstance(projection, (exp.Alias, exp.Column, exp.Star)) else exp.alias_(projection, output_name(projection, read), quoted=True)
+            for projection in tree.expressions
+        ])
+        try:
+            return tree.sql(dialect="duckdb", unsupported_level=sqlglot.ErrorLevel.RAISE)
+        except sqlglot.errors.SqlglotError as error:
+            logging.info("Replica cannot run the query, using the database: %s", error)
+            REPLICA_QUERIES.inc(outcome="fallback")
+            return None
+
+    def execute(self, fetch, dialect):
+        # Arrow table of the bounded query (at most max_rows + 1 rows), or
+        # None when the database has to answer it
+        duck_sql = self.route(fetch.query_sql, dialect)
+        if duck_sql is None:
+            return None
+        cursor = self._conn.cursor()
+        try:
+            with timed("replica_execution"):
+                table = cursor.execute(bounded_sql(duck_sql, fetch.max_rows), fetch.params or None).arrow()
+                if isinstance(table, pa.RecordBatchReader):
+                    table = table.read_all()
+                if table.num_rows > fetch.max_rows and fetch.count_total:
+                    fetch.total_count = cursor.execute(count_sql(duck_sql), fetch.params or None).fetchone()[0]
+        except self.duckdb_error as error:
+            logging.info("Replica query failed, using the database: %s", error)
+            REPLICA_QUERIES.inc(outcome="fallback")
+            return None
+        finally:
+            cursor.close()
+        REPLICA_QUERIES.inc(outcome="served")
+        return table
+
+    def status(self):
+        self.__sync_views()
+        now = time.time()
+        return {
+            table: {"rows": entry["rows"], "age_seconds": round(now - entry["refreshed_at"], 1), "watermark": entry.get("watermark")}
+            for table, entry in self._manifest.items()
+        }
+
+    def refresh(self, engine, force=False):
+        # Copies new rows (or whole tables) from the database into Parquet.
+        # Returns the tables that failed to refresh, or None when another
+        # worker holds the refresh lock. Every worker runs the refresh loop:
+        # tables another worker refreshed within refresh_interval are skipped
+        # unless forced, so each interval reads the database once.
+        failed = []
+        with self.__refresh_lock() as locked:
+            if not locked:
+                return None
+            manifest = self.__read_manifest()
+            now = time.time()
+            for table in self.tables:
+                entry = manifest.get(table)
+                if not force and entry is not None and now - entry["refreshed_at"] < self.refresh_interval:
+                    continue
+                try:
+                    with timed("replica_refresh"):
+                        manifest[table] = self.__refresh_table(engine, table, manifest.get(table))
+                except Exception as error:
+                    logging.warning("Replica refresh of %s failed: %s", table, error)
+                    failed.append(table)
+                    continue
+                self.__write_manifest(manifest)
+                self.__drop_old_generations(table, manifest[table]["generation"])
+        self.__sync_views()
+        return failed
+
+    def __refresh_table(self, engine, table, entry):
+        started = time.time()
+        watermark_column, key_column = self.incremental.get(table, (None, None))
+        full = (
+            entry is None or watermark_column is None or entry.get("watermark") is None
+            or started - entry["full_refreshed_at"] > self.full_refresh_interval
+        )
+        source = f'"{self.schema}"."{table}"' if self.schema else f'"{table}"'
+        query, params = f"SELECT * FROM {source}", {}
+        if not full:
+            # With a key column, rows at the watermark are read again and deduplicated by the view
+            query += f' WHERE "{watermark_column}" {">=" if key_column else ">"} :watermark'
+            params["watermark"] = entry["watermark"]
+
+        generation = f"g{int(started * 1000)}" if full else entry["generation"]
+        parts = 0 if full else entry["parts"]
+        directory = os.path.join(self.path, table, generation)
+        os.makedirs(directory, exist_ok=True)
+        rows = 0 if full else entry["rows"]
+        watermark = None if full else entry["watermark"]
+        schema = None
+        with engine.connect() as conn:
+            # Server-side cursor: without it psycopg2 loads the whole table before pandas chunks it
+            conn = conn.execution_options(stream_results=True, max_row_buffer=self.fetch_batch)
+            for chunk in pd.read_sql_query(sql.text(query), conn, params=params, chunksize=self.fetch_batch):
+                frame = pa.Table.from_pandas(chunk, preserve_index=False)
+                if schema is None:
+                    schema = frame.schema if full or not parts else pq.read_schema(os.path.join(directory, "part-00000.parquet"))
+                    schema = self.__typed_schema(engine, table, schema)
+                pq.write_table(frame.cast(schema), os.path.join(directory, f"part-{parts:05d}.parquet"))
+                parts += 1
+                rows += len(chunk)
+                if watermark_column:
+                    chunk_max = chunk[watermark_column].max()
+                    if pd.notna(chunk_max):
+                        watermark = watermark_value(chunk_max) if watermark is None else max(watermark, watermark_value(chunk_max))
+        if full and parts == 0:
+            # Empty table: still create a part so the view has columns
+            with engine.connect() as conn:
+                empty = pd.read_sql_query(sql.text(f"SELECT * FROM {source} WHERE 1 = 0"), conn)
+            frame = pa.Table.from_pandas(empty, preserve_index=False)
+            pq.write_table(frame.cast(self.__typed_schema(engine, table, frame.schema)), os.path.join(directory, "part-00000.parquet"))
+            parts = 1
+        return {
+            "generation": generation,
+            "parts": parts,
+            "rows": rows,  # Parquet rows; with a key column, updated rows count twice until the next full refresh
+            "watermark": watermark,
+            "key": key_column,
+            "watermark_column": watermark_column,
+            "refreshed_at": started,
+            "full_refreshed_at": started if full else entry["full_refreshed_at"]
+        }
+
+    def __typed_schema(self, engine, table, schema):
+        # Columns that are all null in the first chunk have Arrow type null;
+        # take their type from the database so later chunks with values cast
+        missing = [field.name for field in schema if pa.types.is_null(field.type)]
+        if not missing:
+            return schema
+        columns = {column["name"]: column["type"] for column in sql.inspect(engine).get_columns(table, schema=self.schema)}
+        for name in missing:
+            column_type = arrow_type(columns[name]) if name in columns else pa.string()
+            schema = schema.set(schema.get_field_index(name), pa.field(name, column_type))
+        return schema
+
+    def __sync_views(self):
+        # Views are re-created when another worker (or this one) wrote a new manifest
+        try:
+            mtime = os.stat(self.__manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+            manifest = self.__read_manifest()
+            for table, entry in manifest.items():
+                if self._generations.get(table) == entry["generation"]:
+                    continue
+                files = os.path.join(self.path, table, entry["generation"], "*.parquet").replace("'", "''")
+                view = f'"{self.schema}"."{table}"' if self.schema else f'"{table}"'
+                select = f"SELECT * FROM read_parquet('{files}')"
+                if entry.get("key"):
+                    select += f' QUALIFY row_number() OVER (PARTITION BY "{entry["key"]}" ORDER BY "{entry["watermark_column"]}" DESC) = 1'
+                self._conn.execute(f"CREATE OR REPLACE VIEW {view} AS {select}")
+                self._generations[table] = entry["generation"]
+            self._manifest = manifest
+            self._manifest_mtime = mtime
+
+    def __drop_old_generations(self, table, current):
+        # Keeps the previous generation for queries other workers still have running on it
+        directory = os.path.join(self.path, table)
+        generations = sorted(name for name in os.listdir(directory) if name != current)
+        for name in generations[:-1]:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def __manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def __read_manifest(self):
+        try:
+            with open(self.__manifest_path(), encoding="utf-8") as manifest:
+                return json.load(manifest)
+        except FileNotFoundError:
+            return {}
+
+    def __write_manifest(self, manifest):
+        temporary = self.__manifest_path() + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as output:
+            json.dump(manifest, output, default=str)
+        os.replace(temporary, self.__manifest_path())
+
+    @contextmanager
+    def __refresh_lock(self):
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.path, ".refresh.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,9 +1,113 @@
 # backend_core.py
-from src.generative_ai import SQLNaturaLanguage
+import threading
+from src.generative_ai import SQLNaturaLanguage, BATCH_CONCURRENCY, is_follow_up
+from src.sql_cache import normalize_question
+from src.single_flight import SingleFlight, COALESCE_ENABLED, flight_key
+
+# One warm agent per (temperature, model) for the whole worker process, so the
+# engine pool, reflected schema and LLM clients are shared across requests.
+_agents = {}
+_agents_lock = threading.Lock()
+
+# Identical questions in flight at the same time share one execution
+_flights = SingleFlight()
+
+def get_agent(temperature=0, model="gemini-2.5-flash"):
+    key = (temperature, model)
+    agent = _agents.get(key)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(key)
+            if agent is None:
+                agent = SQLNaturaLanguage(temperature=temperature, model=model)
+                _agents[key] = agent
+    return agent
+
+async def shutdown_agents():
+    with _agents_lock:
+        agents = list(_agents.values())
+        _agents.clear()
+    for agent in agents:
+        await agent.aclose()
+
+def dedupe_prompts(prompts):
+    # Unique prompts (by normalized text) and, for each, the input positions it answers
+    unique, positions = [], {}
+    for index, prompt in enumerate(prompts):
+        key = normalize_question(prompt)
+        if key not in positions:
+            positions[key] = []
+            unique.append(prompt)
+        positions[key].append(index)
+    return unique, [positions[normalize_question(prompt)] for prompt in unique]
 
 class QueryExecutor:
     def __init__(self, temperature=0, model="gemini-2.5-flash"):
-        self.agent = SQLNaturaLanguage(temperature=temperature, model=model)
+        self.temperature = temperature
+        self.model = model
+        self.agent = get_agent(temperature=temperature, model=model)
 
     def execute(self, prompt: str, context_summary: str = None):
-        return self.agent.execution(prompt=prompt, context_summary=context_summary)
\ No newline at end of file
+        if not COALESCE_ENABLED:
+            return self.agent.execution(prompt=prompt, context_summary=context_summary)
+        return _flights.run(
+            self.__flight_key(prompt, context_summary),
+            lambda: self.agent.execution(prompt=prompt, context_summary=context_summary)
+        )
+
+    async def aexecute(self, prompt: str, context_summary: str = None):
+        if not COALESCE_ENABLED:
+            return await self.agent.aexecution(prompt=prompt, context_summary=context_summary)
+        return await _flights.arun(
+            self.__flight_key(prompt, context_summary),
+            lambda: self.agent.aexecution(prompt=prompt, context_summary=context_summary)
+        )
+
+    def batch(self, prompts, max_concurrency=BATCH_CONCURRENCY):
+        # Results in input order; failed items carry an "error" instead of raising
+        unique, positions = dedupe_prompts(prompts)
+        results = [None] * len(prompts)
+        for output, indexes in zip(self.agent.batch_execution(unique, max_concurrency), positions):
+            for index in indexes:
+                results[index] = dict(output)
+        return results
+
+    async def abatch_stream(self, prompts, max_concurrency=BATCH_CONCURRENCY):
+        # Yields (input index, result) as each question completes; duplicates
+        # are answered once and yielded for every index that asked them.
+        unique, positions = dedupe_prompts(prompts)
+        async for position, output in self.agent.abatch_execution(unique, max_concurrency):
+            for index in positions[position]:
+                yield index, dict(output)
+
+    async def abatch(self, prompts, max_concurrency=BATCH_CONCURRENCY):
+        results = [None] * len(prompts)
+        async for index, output in self.abatch_stream(prompts, max_concurrency):
+            results[index] = output
+        return results
+
+    def refresh_schema(self):
+        return self.agent.refresh_schema()
+
+    def cache_stats(self):
+        return self.agent.cache_stats()
+
+    def refresh_replica(self, force=False):
+        return self.agent.refresh_replica(force)
+
+    def replica_status(self):
+        return self.agent.replica_status()
+
+    def list_templates(self):
+        return self.agent.list_templates()
+
+    def register_template(self, pattern, query_sql, formats=None):
+        return self.agent.register_template(pattern, query_sql, formats)
+
+    def remove_template(self, pattern):
+        return self.agent.remove_template(pattern)
+
+    def __flight_key(self, prompt, context_summary):
+        # Context only changes the answer when it is injected, i.e. for follow-ups
+        context = context_summary if context_summary and is_follow_up(prompt) else ""
+        return flight_key(f"{self.temperature}:{self.model}", prompt, context)
@@ -0,0 +1,149 @@
+# context_summary.py
+import warnings
+import pandas as pd
+
+CONTEXT_MAX_ITEMS = 50  # Reduced for performance
+
+# Inserts Indian-system separators into the integer part of a "1234567.00"
+# string: 12,34,567.00
+INDIAN_GROUPING = r"(\d)(?=(?:\d{2})*\d{3}\.)"
+
+def column_label(col):
+    return col.replace('_', ' ').title()
+
+def po_id_column(df):
+    return "po_id" if "po_id" in df.columns else "purchase_order_id" if "purchase_order_id" in df.columns else None
+
+def date_value(value):
+    # Timestamp at its wall-clock time (any time zone dropped), or NaT
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return pd.NaT
+    return timestamp.tz_localize(None) if timestamp.tzinfo is not None else timestamp
+
+def parse_dates(values):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # "Could not infer format"
+            warnings.simplefilter("ignore", FutureWarning)  # Mixed time zones
+            parsed = pd.to_datetime(values, errors="coerce")
+    except (ValueError, TypeError):
+        parsed = None
+    if parsed is None or not pd.api.types.is_datetime64_any_dtype(parsed.dtype):  # e.g. mixed time zones
+        return pd.to_datetime(values.map(date_value))
+    if parsed.dt.tz is not None:
+        parsed = parsed.dt.tz_localize(None)
+    # Values that do not match the inferred format are parsed one by one
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        parsed = parsed.mask(unparsed, pd.to_datetime(values[unparsed].map(date_value)))
+    return parsed
+
+def format_dates(values):
+    # YYYY-MM-DD, or the value as text when it is not a date
+    parsed = parse_dates(values)
+    unparsed = parsed.isna() & values.notna()
+    return parsed.dt.strftime('%Y-%m-%d').mask(unparsed, values[unparsed].astype(str))
+
+def as_text(values):
+    # Integral floats (integer ids from a column with nulls) print without ".0"
+    present = values.dropna()
+    if pd.api.types.is_float_dtype(values.dtype) and (present % 1 == 0).all():
+        return present.astype("int64").astype(str).reindex(values.index)
+    return values.astype(str).where(values.notna())
+
+def format_numbers(values):
+    formatted = values.map('{:.2f}'.format).str.replace(INDIAN_GROUPING, r"\1,", regex=True)
+    return formatted.where(values.notna())
+
+def format_column(col, values):
+    if "date" in col.lower():
+        formatted = format_dates(values)
+    elif str(values.dtype) in ("int64", "float64"):
+        formatted = format_numbers(values)
+    else:
+        formatted = values.astype(str).where(values.notna())
+    return formatted.fillna('null').tolist()
+
+def format_frame(df):
+    # Formats each column once instead of re-checking dtypes per cell
+    return [format_column(col, df[col]) for col in df.columns]
+
+def build_context_summary(df, max_items=CONTEXT_MAX_ITEMS):
+    if df.empty:
+        return ""
+
+    summary_parts = [f"Total records: {len(df)}"]
+    labels = [column_label(col) for col in df.columns]
+    id_col = po_id_column(df)
+
+    if id_col:
+        # First row of each purchase order, in order of appearance
+        rows = df.drop_duplicates(subset=id_col, keep="first").head(max_items).reset_index(drop=True)
+        ids = rows[id_col].tolist()
+        for po_id, values in zip(ids, zip(*format_frame(rows))):
+            po_summary = [f"For Purchase Order ID: {po_id}"]
+            po_summary.extend(f"  {label}: {value}" for label, value in zip(labels, values))
+            summary_parts.append("\n".join(po_summary))
+    else:
+        rows = df.head(max_items)
+        for position, values in enumerate(zip(*format_frame(rows)), start=1):
+            formatted_row = ", ".join(f"{label}: {value}" for label, value in zip(labels, values))
+            summary_parts.append(f"Row {position}: {formatted_row}")
+        if len(df) > max_items:
+            summary_parts.append(f"... (showing first {max_items} of {len(df)} rows)")
+
+    return "\n".join(summary_parts)
+
+def key_column(df):
+    # The column whose values identify the rows a follow-up refers to
+    id_col = po_id_column(df)
+    if id_col:
+        return id_col
+    for col in df.columns:
+        if col.lower() == "id" or col.lower().endswith("_id"):
+            return col
+    return None
+
+def column_digest(col, values, samples=3):
+    # Range for numbers and dates, a few distinct values for text
+    present = values.dropna()
+    if present.empty:
+        return "all null"
+    if "date" in col.lower() or pd.api.types.is_datetime64_any_dtype(values.dtype):
+        dates = parse_dates(present).dropna()
+        if not dates.empty:
+            return f"{dates.min():%Y-%m-%d} to {dates.max():%Y-%m-%d}"
+    if "year" in col.lower() and str(values.dtype) in ("int64", "float64"):
+        return f"{int(present.min())} to {int(present.max())}"
+    if str(values.dtype) in ("int64", "float64"):
+        low, high = format_numbers(pd.Series([present.min(), present.max()], dtype="float64")).tolist()
+        return f"{low} to {high}"
+    distinct = as_text(present).unique()
+    examples = ", ".join(distinct[:samples])
+    return f"{len(distinct)} distinct, e.g. {examples}" if len(distinct) > samples else examples
+
+def build_context_entry(df, question, max_items=CONTEXT_MAX_ITEMS):
+    # Compact, JSON-serializable stand-in for build_context_summary, kept in
+    # the session store and only rendered when a follow-up needs it.
+    entry = {"question": question, "rows": len(df)}
+    if df.empty:
+        return entry
+    id_col = key_column(df)
+    if id_col:
+        entry["key"] = id_col
+        entry["ids"] = as_text(df[id_col].dropna()).unique()[:max_items].tolist()
+    entry["columns"] = {col: column_digest(col, df[col]) for col in df.columns if col != id_col}
+    return entry
+
+def render_context_entries(entries):
+    parts = []
+    for entry in entries:
+        lines = [f"Question: {entry['question']}", f"Total records: {entry['rows']}"]
+        if entry.get("ids"):
+            label = "Purchase Order IDs" if entry["key"] in ("po_id", "purchase_order_id") else column_label(entry["key"])
+            lines.append(f"{label} ({entry['key']}): {', '.join(entry['ids'])}")
+        lines.extend(f"  {column_label(col)}: {digest}" for col, digest in entry.get("columns", {}).items())
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,87 @@
+# fast_summary.py
+import os
+from src.context_summary import as_text, format_dates, format_numbers, po_id_column
+
+FAST_SUMMARY_ENABLED = os.getenv("FAST_SUMMARY_ENABLED", "true").lower() == "true"
+FAST_SUMMARY_MAX_ROWS = int(os.getenv("FAST_SUMMARY_MAX_ROWS", "10"))
+FAST_SUMMARY_MAX_COLUMNS = int(os.getenv("FAST_SUMMARY_MAX_COLUMNS", "8"))
+
+# Questions whose answer needs reasoning beyond restating the rows
+LLM_ONLY_KEYWORDS = ("risk", "delay", "why", "compare", "trend", "analy", "insight", "recommend")
+
+ACRONYMS = {"po": "PO", "id": "ID", "gst": "GST", "uom": "UOM", "bom": "BOM", "hsn": "HSN"}
+
+# Integers keep no decimals: 100000 -> 1,00,000
+INDIAN_INTEGER_GROUPING = r"(\d)(?=(?:\d{2})*\d{3}$)"
+
+def summary_label(col):
+    # po_price_total -> PO Price Total
+    return " ".join(ACRONYMS.get(word.lower(), word.capitalize()) for word in col.split("_") if word)
+
+def use_fast_summary(df, question, truncated=False):
+    if not FAST_SUMMARY_ENABLED or df.empty or truncated:
+        return False
+    if len(df) > FAST_SUMMARY_MAX_ROWS or len(df.columns) > FAST_SUMMARY_MAX_COLUMNS:
+        return False
+    question = question.lower()
+    return not any(keyword in question for keyword in LLM_ONLY_KEYWORDS)
+
+def format_summary_column(col, values):
+    # Identifiers and years are shown as-is, never digit-grouped
+    if col.lower() == "id" or col.lower().endswith("_id") or "year" in col.lower():
+        formatted = as_text(values)
+    elif "date" in col.lower():
+        formatted = format_dates(values)
+    elif str(values.dtype) == "int64":
+        formatted = values.map(str).str.replace(INDIAN_INTEGER_GROUPING, r"\1,", regex=True)
+    elif str(values.dtype) == "float64":
+        formatted = format_numbers(values)
+    else:
+        formatted = values.astype(str).where(values.notna())
+    return formatted.fillna("N/A").tolist()
+
+def headline(df, count, id_col):
+    if len(df) == 1 and len(df.columns) == 1:
+        return f"The query returned a single value for {summary_label(df.columns[0])}, shown below."
+    noun = "record" if count == 1 else "records"
+    if id_col:
+        orders = df[id_col].nunique()
+        order_noun = "purchase order" if orders == 1 else "purchase orders"
+        return f"Found {count} matching {noun} across {orders} {order_noun}, detailed below."
+    return f"Found {count} matching {noun} for your question, listed row by row below."
+
+# Rule-based markdown following the summary prompt's formatting contract, used
+# instead of a second LLM call for small results.
+def render_fast_summary(df, count=None):
+    count = count if count is not None else len(df)
+    id_col = po_id_column(df)
+    labels = [summary_label(col) for col in df.columns]
+    columns = [format_summary_column(col, df[col]) for col in df.columns]
+    rows = list(zip(*columns))
+
+    lines = [headline(df, count, id_col), ""]
+    if len(df) == 1 and len(df.columns) == 1:
+        lines.append(f"* {labels[0]}: {rows[0][0]}")
+    elif id_col:
+        id_position = list(df.columns).index(id_col)
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[id_position], []).append(row)
+        for po_id, group in groups.items():
+            lines.append(f"**For Purchase Order ID: {po_id}**")
+            fields = [
+                [f"{label}: {value}" for position, (label, value) in enumerate(zip(labels, row)) if position != id_position]
+                for row in group
+            ]
+            if len(fields) == 1:
+                lines.extend(f"* {field}" for field in fields[0])
+            else:
+                # One bullet per row, so the rows of an order stay apart
+                lines.extend(f"* {'; '.join(row_fields)}" for row_fields in fields)
+            lines.append("")
+    else:
+        for number, row in enumerate(rows, start=1):
+            lines.append(f"**Row {number}**")
+            lines.extend(f"* {label}: {value}" for label, value in zip(labels, row))
+            lines.append("")
+    return "\n".join(lines).strip()
@@ -1,30 +1,59 @@
 import pandas as pd
 import sqlalchemy as sql
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.sql_database import SQLDatabase
-from langchain_experimental.sql import SQLDatabaseChain
+from langchain_community.utilities import SQLDatabase
+from langchain.chains.sql_database.prompt import SQL_PROMPTS, PROMPT as DEFAULT_SQL_PROMPT
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableSequence
 import re
 import logging
-import sys
 import os
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.ext.asyncio import create_async_engine
 from dotenv import load_dotenv
 from datetime import datetime
+from src.sql_cache import SQLTranslationCache, SQL_CACHE_ENABLED, make_cache_key, schema_fingerprint
+from src.result_fetch import BoundedFetch, RESULT_FETCH_BATCH, RESULT_MAX_ROWS
+from src.context_summary import build_context_summary
+from src.fast_summary import use_fast_summary, render_fast_summary
+from src.schema_index import SchemaIndex, SCHEMA_PRUNING, estimate_tokens, extract_question
+from src.sql_guard import SQLGuard, SQL_GUARD_ENABLED
+from src.analytics_replica import AnalyticsReplica, REPLICA_ENABLED
+from src.query_templates import QueryTemplate, QueryTemplateStore, QUERY_TEMPLATES_ENABLED, TEMPLATE_AUTO_PROMOTE, load_template_file
+from src.metrics import timed, RESULT_ROWS, LLM_TOKENS, SQL_CACHE_LOOKUPS, SUMMARY_PATHS
+from src.request_log import configure_logging
 
 load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s — %(name)s — %(levelname)s — %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+configure_logging()
 
 INCLUDED_TABLES = os.getenv("INCLUDED_TABLES", "").split(",")
 
+# Connection pool sizing, shared by every request served from one worker
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+
+# Async request path: driver for the async engine and per-worker limits on
+# in-flight LLM calls and database queries
+ASYNC_DB_DRIVER = os.getenv("ASYNC_DB_DRIVER", "asyncpg")  # asyncpg or psycopg
+# Full SQLAlchemy URLs that replace the POSTGRES_* settings, e.g. a local
+# SQLite file for the offline benchmarks
+DATABASE_URL = os.getenv("DATABASE_URL")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "100"))
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # Questions of one batch worked on at once
+
 DISALLOWED_KEYWORDS = ["DROP", "DELETE", "ALTER", "TRUNCATE", "INSERT", "UPDATE"]
 
+# Words that make a question refer back to the previous answers
+FOLLOW_UP_WORDS = ["these", "those", "them", "above", "mentioned"]
+
 PROMPT = """
 You are an expert SQL assistant. Translate the following natural language question into a SQL query for a PostgreSQL database. 
 Ensure the query:
@@ -64,23 +93,146 @@ def clean_sql_query(sql):
             raise ValueError(f"Query contains a disallowed keyword: {keyword}")
     return sql.strip()
 
+def is_follow_up(question):
+    # Checked on the question alone: the PROMPT instructions around it
+    # contain "them" themselves.
+    return any(word in extract_question(question).lower() for word in FOLLOW_UP_WORDS)
+
+def sql_cache_outcome(generated):
+    # SQL from a question template never goes through the cache
+    if generated.get("sql_template") is not None:
+        return None
+    return "hit" if generated["cache_hit"] else "miss"
+
+def database_url(driver=None):
+    if driver and ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    if not driver and DATABASE_URL:
+        return DATABASE_URL
+    scheme = f"postgresql+{driver}" if driver else "postgresql"
+    return f"{scheme}://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
+
+def create_sql_engine():
+    return sql.create_engine(
+        database_url(),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+
+def create_async_sql_engine():
+    return create_async_engine(
+        database_url(ASYNC_DB_DRIVER),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+
 class SQLNaturaLanguage():
-    def __init__(self, temperature=0, model="gemini-2.5-flash"):
-        db_url = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-        sql_engine = sql.create_engine(db_url)
-        self.db = SQLDatabase(
-            engine=sql_engine,
-            include_tables=INCLUDED_TABLES,
-            schema=os.getenv("POSTGRES_SCHEMA"),
-            view_support = True
-        )
-        self.conn = sql_engine.connect()
+    def __init__(self, temperature=0, model="gemini-2.5-flash", engine=None, async_engine=None):
+        # The engine owns the connection pool; queries check a connection out
+        # per call instead of holding one open for the lifetime of the agent.
+        self.engine = engine if engine is not None else create_sql_engine()
+        self._async_engine = async_engine
+        self.llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+        self.db_semaphore = asyncio.Semaphore(DB_CONCURRENCY)
         self.API_KEY = os.getenv("GOOGLE_API_KEY")
         self.temperature = temperature
         self.model = model
         self.llm = self.__create_model()
-        self.sql_model = self.__create_sqlchain()
         self.summary_model = self.__create_summary_chain()
+        self.sql_cache = SQLTranslationCache() if SQL_CACHE_ENABLED else None
+        self.templates = QueryTemplateStore() if QUERY_TEMPLATES_ENABLED else None
+        self.replica = AnalyticsReplica(INCLUDED_TABLES, os.getenv("POSTGRES_SCHEMA")) if REPLICA_ENABLED else None
+        self._schema_lock = threading.Lock()
+        self.refresh_schema()
+        self.__register_template_file()
+
+    def refresh_schema(self):
+        # Reflect outside the lock so in-flight queries keep using the old
+        # schema until the new one is ready, then swap both references at once.
+        db = self.__create_database()
+        sql_model = self.__create_sqlchain(db)
+        schema_index = SchemaIndex(db)
+        fingerprint = schema_fingerprint(db)
+        sql_guard = SQLGuard(schema_index.tables, os.getenv("POSTGRES_SCHEMA")) if SQL_GUARD_ENABLED else None
+        with self._schema_lock:
+            self.db = db
+            self.sql_model = sql_model
+            self.schema_index = schema_index
+            self.sql_guard = sql_guard
+            self.schema_fingerprint = fingerprint
+        if self.sql_cache is not None:
+            self.sql_cache.set_fingerprint(fingerprint)
+        if self.templates is not None:
+            self.templates.set_fingerprint(fingerprint)
+        tables = sorted(db.get_usable_table_names())
+        logging.info("Schema reflected for tables: %s", ", ".join(tables))
+        return tables
+
+    @property
+    def async_engine(self):
+        # Created on first use so sync-only callers (Streamlit) never need the async driver
+        if self._async_engine is None:
+            self._async_engine = create_async_sql_engine()
+        return self._async_engine
+
+    def close(self):
+        self.engine.dispose()
+
+    async def aclose(self):
+        self.engine.dispose()
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+
+    def cache_stats(self):
+        return self.sql_cache.stats() if self.sql_cache is not None else {"enabled": False}
+
+    def refresh_replica(self, force=False):
+        return self.replica.refresh(self.engine, force) if self.replica is not None else None
+
+    def replica_status(self):
+        return self.replica.status() if self.replica is not None else {"enabled": False}
+
+    def list_templates(self):
+        return self.templates.list_templates() if self.templates is not None else []
+
+    def register_template(self, pattern, query_sql, formats=None):
+        # Registered templates skip the LLM entirely, so they are checked up
+        # front: slots must match the SQL parameters and the SQL must pass
+        # the guard's AST validation.
+        if self.templates is None:
+            raise ValueError("Question templates are disabled")
+        template = QueryTemplate(pattern, query_sql, formats)
+        sql_guard = self.sql_guard
+        if sql_guard is not None:
+            sql_guard.validate(template.query_sql, self.engine.dialect.name)
+        self.templates.add(template)
+        return template.info()
+
+    def remove_template(self, pattern):
+        return self.templates.remove(pattern) if self.templates is not None else False
+
+    def __register_template_file(self):
+        if self.templates is None:
+            return
+        for entry in load_template_file():
+            try:
+                self.register_template(entry["pattern"], entry["sql"], entry.get("formats"))
+            except (KeyError, ValueError) as error:
+                logging.warning("Skipping template %r from the template file: %s", entry.get("pattern"), error)
+
+    def __create_database(self):
+        return SQLDatabase(
+            engine=self.engine,
+            include_tables=INCLUDED_TABLES,
+            schema=os.getenv("POSTGRES_SCHEMA"),
+            view_support = True
+        )
 
     def __create_model(self):
         return ChatGoogleGenerativeAI(
@@ -89,13 +241,17 @@ class SQLNaturaLanguage():
             google_api_key=self.API_KEY
         )
 
-    def __create_sqlchain(self):
-        return SQLDatabaseChain.from_llm(
-            llm=self.llm,
-            db=self.db,
-            verbose=True,
-            return_intermediate_steps=True,
-            top_k=50  # Reduced for performance
+    def __create_sqlchain(self, db):
+        # Generates the SQL only; we run it ourselves, so there is no need for
+        # SQLDatabaseChain's extra query execution and answer LLM call. Table
+        # info is supplied per question from the schema index.
+        prompt = SQL_PROMPTS.get(db.dialect, DEFAULT_SQL_PROMPT)
+        if "dialect" in prompt.input_variables:
+            prompt = prompt.partial(dialect=db.dialect)
+        return RunnableSequence(
+            prompt.partial(top_k="50")  # Reduced for performance
+            | self.llm.bind(stop=["\nSQLResult:"])
+            | StrOutputParser()
         )
 
     def __create_summary_chain(self):
@@ -130,72 +286,468 @@ Question:
         )
         return RunnableSequence(prompt_template | self.llm | StrOutputParser())
 
+    def __prepare_generation(self, prompt, context_summary):
+        full_prompt = prompt
+        if context_summary and is_follow_up(prompt):
+            full_prompt = f"{prompt}\nContext Info (Previous Answer Summary):\n{context_summary}"
+
+        with self._schema_lock:
+            sql_model = self.sql_model
+            schema_index = self.schema_index
+            fingerprint = self.schema_fingerprint
+
+        return {
+            "sql_model": sql_model,
+            "schema_index": schema_index,
+            "question": extract_question(prompt),
+            "follow_up": full_prompt != prompt,
+            "full_prompt": full_prompt,
+            "ranking_text": f"{extract_question(prompt)} {full_prompt[len(prompt):]}",
+            "cache_key": make_cache_key(full_prompt, fingerprint),
+            "fingerprint": fingerprint
+        }
+
+    def __sql_inputs(self, generated, schema_index):
+        # Rank tables on the question (plus any injected context) and only send
+        # the matching ones; fall back to the full schema when nothing matches.
+        with timed("prompt_build"):
+            tables = None
+            if SCHEMA_PRUNING:
+                tables = schema_index.select(generated["ranking_text"])
+            table_info = schema_index.render(tables) if tables else schema_index.full_info
+            generated["schema_tables"] = tables or schema_index.tables
+            generated["prompt_tokens"] = {
+                "full_schema": schema_index.full_tokens + estimate_tokens(generated["full_prompt"]),
+                "sent": estimate_tokens(table_info) + estimate_tokens(generated["full_prompt"])
+            }
+        LLM_TOKENS.observe(generated["prompt_tokens"]["sent"], call="sql", direction="prompt")
+        logging.debug("SQL prompt tables: %s (~%s tokens, ~%s with full schema)",
+                     ", ".join(generated["schema_tables"]), generated["prompt_tokens"]["sent"], generated["prompt_tokens"]["full_schema"])
+        return {"input": generated["full_prompt"] + "\nSQLQuery: ", "table_info": table_info}
+
+    def __clean_sql(self, response):
+        LLM_TOKENS.observe(estimate_tokens(response), call="sql", direction="response")
+        with timed("sql_cleaning"):
+            return clean_sql_query(response)
+
+    def __count_lookup(self, generated):
+        if self.sql_cache is not None:
+            SQL_CACHE_LOOKUPS.inc(outcome="hit" if generated["cache_hit"] else "miss")
+
+    def __match_template(self, generated):
+        # Follow-ups depend on the injected context, which templates cannot see
+        if self.templates is None or generated["follow_up"]:
+            return False
+        with timed("template_match"):
+            matched = self.templates.match(generated["question"])
+        if matched is None:
+            return False
+        template, params = matched
+        generated.update(query_sql=template.query_sql, query_params=params, sql_template=template.pattern, cache_hit=False)
+        return True
+
+    def __lookup_sql(self, prompt, context_summary):
+        # Template match, then cache lookup; on a miss, also the inputs for the SQL chain
+        generated = self.__prepare_generation(prompt, context_summary)
+        sql_model = generated.pop("sql_model")
+        schema_index = generated.pop("schema_index")
+        if self.__match_template(generated):
+            return generated, sql_model, None
+        generated["query_sql"] = self.sql_cache.get(generated["cache_key"]) if self.sql_cache is not None else None
+        generated["cache_hit"] = generated["query_sql"] is not None
+        self.__count_lookup(generated)
+        inputs = None if generated["cache_hit"] else self.__sql_inputs(generated, schema_index)
+        return generated, sql_model, inputs
+
+    async def __alookup_sql(self, prompt, context_summary):
+        # The persistent cache and the template store do blocking SQLite I/O; keep it off the event loop
+        if (self.sql_cache is not None and self.sql_cache.path) or self.templates is not None:
+            return await asyncio.to_thread(self.__lookup_sql, prompt, context_summary)
+        return self.__lookup_sql(prompt, context_summary)
+
+    def generate_sql(self, prompt, context_summary=None):
+        generated, sql_model, inputs = self.__lookup_sql(prompt, context_summary)
+        if inputs is not None:
+            with timed("sql_generation"):
+                response = sql_model.invoke(inputs)
+            generated["query_sql"] = self.__clean_sql(response)
+        return generated
+
+    async def agenerate_sql(self, prompt, context_summary=None):
+        generated, sql_model, inputs = await self.__alookup_sql(prompt, context_summary)
+        if inputs is not None:
+            async with self.llm_semaphore:
+                with timed("sql_generation"):
+                    response = await sql_model.ainvoke(inputs)
+            generated["query_sql"] = self.__clean_sql(response)
+        return generated
+
+    def remember_sql(self, generated):
+        # Only cache SQL that actually ran, so a bad translation is retried next time
+        if generated.get("sql_template") is not None or generated["cache_hit"]:
+            return
+        if self.sql_cache is not None:
+            self.sql_cache.set(generated["cache_key"], generated["query_sql"], generated["fingerprint"])
+        # Freshly generated SQL that ran counts towards promoting its question shape
+        if self.templates is not None and TEMPLATE_AUTO_PROMOTE and not generated["follow_up"]:
+            self.templates.observe(generated["question"], generated["query_sql"], self.engine.dialect.name, generated["fingerprint"])
+
+    async def aremember_sql(self, generated):
+        if (self.sql_cache is not None and self.sql_cache.path) or self.templates is not None:
+            await asyncio.to_thread(self.remember_sql, generated)
+        else:
+            self.remember_sql(generated)
+
+    def guard_sql(self, conn, query_sql, max_rows=RESULT_MAX_ROWS, params=None):
+        # Validates the SQL and checks its plan on the connection that will run it
+        sql_guard = self.sql_guard
+        return sql_guard.check(conn, query_sql, max_rows, params) if sql_guard is not None else None
+
+    async def aguard_sql(self, conn, query_sql, max_rows=RESULT_MAX_ROWS, params=None):
+        sql_guard = self.sql_guard
+        return await sql_guard.acheck(conn, query_sql, max_rows, params) if sql_guard is not None else None
+
+    def read_replica(self, fetch):
+        # Arrow result from the analytics replica for a fresh enough aggregate,
+        # or None to run the query on the database. The guard's AST checks
+        # still apply; its EXPLAIN protects the database and is skipped.
+        if self.replica is None:
+            return None
+        sql_guard = self.sql_guard
+        if sql_guard is not None:
+            sql_guard.validate(fetch.query_sql, self.engine.dialect.name)
+        table = self.replica.execute(fetch, self.engine.dialect.name)
+        if table is not None:
+            fetch.guard = "unplanned"
+        return table
+
+    async def aread_sql(self, fetch):
+        if self.replica is not None:
+            table = await asyncio.to_thread(self.read_replica, fetch)
+            if table is not None:
+                return fetch.from_arrow(table)
+        async with self.db_semaphore:
+            async with self.async_engine.connect() as conn:
+                fetch.guard = await self.aguard_sql(conn, fetch.query_sql, fetch.max_rows, fetch.params)
+                return await fetch.afetch_all(conn)
+
+    def summary_inputs(self, query_df, prompt, count=None):
+        inputs = {
+            "table": query_df.head(50).to_markdown(index=False),  # Reduced for performance
+            "question": prompt,  # Use original question to exclude context
+            "count": count if count is not None else len(query_df),
+            "date": datetime.today().strftime("%d-%m-%Y")
+        }
+        LLM_TOKENS.observe(estimate_tokens(self.summary_model.first.format(**inputs)), call="summary", direction="prompt")
+        return inputs
+
+    def __fast_summary(self, query_df, count):
+        with timed("summary_rule"):
+            summary = render_fast_summary(query_df, count)
+        SUMMARY_PATHS.inc(path="rule")
+        return summary
+
+    def __record_llm_summary(self, summary):
+        SUMMARY_PATHS.inc(path="llm")
+        LLM_TOKENS.observe(estimate_tokens(summary), call="summary", direction="response")
+
     def execution(self, prompt=None, context_summary=None):
         try:
-            full_prompt = prompt
-            if context_summary and any(word in prompt.lower() for word in ["these", "those", "them", "above", "mentioned"]):
-                full_prompt = f"{prompt}\nContext Info (Previous Answer Summary):\n{context_summary}"
+            return self.__run_generated(prompt, self.generate_sql(prompt, context_summary))
+        except Exception as error:
+            return {"error": str(error)}
+
+    def __run_generated(self, prompt, generated):
+        # Runs the generated SQL and summarizes the result
+        query_sql = generated["query_sql"]
+        fetch = BoundedFetch(query_sql, params=generated.get("query_params"))
+        table = self.read_replica(fetch)
+        if table is not None:
+            query_df = fetch.from_arrow(table)
+        else:
+            with self.engine.connect() as conn:
+                fetch.guard = self.guard_sql(conn, query_sql, fetch.max_rows, fetch.params)
+                query_df = fetch.fetch_all(conn)
+        RESULT_ROWS.observe(len(query_df))
+        self.remember_sql(generated)
 
-            res = self.sql_model(full_prompt)
-            query_sql = [elem["sql_cmd"] for elem in res["intermediate_steps"] if "sql_cmd" in elem][0]
-            query_sql = clean_sql_query(query_sql)
-            query_df = pd.read_sql_query(sql.text(query_sql), self.conn)
+        output = {"query_df": query_df, "query_sql": query_sql, "sql_cache": sql_cache_outcome(generated),
+                  "sql_template": generated.get("sql_template"), "prompt_tokens": generated.get("prompt_tokens"), **fetch.info()}
 
-            output = {"query_df": query_df, "query_sql": query_sql}
+        if not query_df.empty:
+            if use_fast_summary(query_df, extract_question(prompt), fetch.truncated):
+                output["result"] = self.__fast_summary(query_df, fetch.total_count)
+                output["summary_path"] = "rule"
+            else:
+                inputs = self.summary_inputs(query_df, prompt, fetch.total_count)
+                with timed("summary_llm"):
+                    output["result"] = self.summary_model.invoke(inputs)
+                self.__record_llm_summary(output["result"])
+                output["summary_path"] = "llm"
 
+        return output
+
+    def execution_stream(self, prompt=None, context_summary=None, batch_size=RESULT_FETCH_BATCH, include_context=False):
+        # Same pipeline as execution, but yields (event, payload) pairs as each
+        # stage finishes: the SQL, row batches off a server-side cursor, then
+        # the summary tokens and, with include_context (the Streamlit app keeps
+        # it for follow-ups), the context summary.
+        try:
+            generated = self.generate_sql(prompt, context_summary)
+            query_sql = generated["query_sql"]
+            yield "sql", {"query_sql": query_sql, "query_params": generated.get("query_params"), "sql_cache": sql_cache_outcome(generated),
+                          "sql_template": generated.get("sql_template"), "prompt_tokens": generated.get("prompt_tokens")}
+
+            chunks = []
+            fetch = BoundedFetch(query_sql, params=generated.get("query_params"), batch_size=batch_size)
+            table = self.read_replica(fetch)
+            if table is not None:
+                for chunk in fetch.arrow_chunks(table):
+                    chunks.append(chunk)
+                    yield "rows", chunk
+            else:
+                with self.engine.connect() as conn:
+                    fetch.guard = self.guard_sql(conn, query_sql, fetch.max_rows, fetch.params)
+                    for chunk in fetch.chunks(conn):
+                        chunks.append(chunk)
+                        yield "rows", chunk
+            self.remember_sql(generated)
+
+            query_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            RESULT_ROWS.observe(len(query_df))
             if not query_df.empty:
-                full_count = len(query_df)
-                df_preview = query_df.head(50).to_markdown(index=False)  # Reduced for performance
-                summary = self.summary_model.invoke({
-                    "table": df_preview,
-                    "question": prompt,  # Use original question to exclude context
-                    "count": full_count,
-                    "date": datetime.today().strftime("%d-%m-%Y")
-                })
-                output["result"] = summary
-                output["context_summary"] = self.__generate_context_summary(query_df)
-
-            return output
+                if use_fast_summary(query_df, extract_question(prompt), fetch.truncated):
+                    yield "summary", self.__fast_summary(query_df, fetch.total_count)
+                    yield "summary_path", "rule"
+                else:
+                    tokens = []
+                    inputs = self.summary_inputs(query_df, prompt, fetch.total_count)
+                    with timed("summary_llm"):
+                        for token in self.summary_model.stream(inputs):
+                            tokens.append(token)
+                            yield "summary", token
+                    self.__record_llm_summary("".join(tokens))
+                    yield "summary_path", "llm"
+                if include_context:
+                    yield "context", self.__generate_context_summary(query_df)
+            yield "done", fetch.info()
+
+        except Exception as error:
+            yield "error", {"error": str(error)}
 
+    async def aexecution(self, prompt=None, context_summary=None):
+        try:
+            return await self.__arun_generated(prompt, await self.agenerate_sql(prompt, context_summary))
         except Exception as error:
             return {"error": str(error)}
 
+    async def __arun_generated(self, prompt, generated):
+        query_sql = generated["query_sql"]
+        fetch = BoundedFetch(query_sql, params=generated.get("query_params"))
+        query_df = await self.aread_sql(fetch)
+        RESULT_ROWS.observe(len(query_df))
+        await self.aremember_sql(generated)
+
+        output = {"query_df": query_df, "query_sql": query_sql, "sql_cache": sql_cache_outcome(generated),
+                  "sql_template": generated.get("sql_template"), "prompt_tokens": generated.get("prompt_tokens"), **fetch.info()}
+
+        if not query_df.empty:
+            if use_fast_summary(query_df, extract_question(prompt), fetch.truncated):
+                output["result"] = self.__fast_summary(query_df, fetch.total_count)
+                output["summary_path"] = "rule"
+            else:
+                inputs = self.summary_inputs(query_df, prompt, fetch.total_count)
+                async with self.llm_semaphore:
+                    with timed("summary_llm"):
+                        output["result"] = await self.summary_model.ainvoke(inputs)
+                self.__record_llm_summary(output["result"])
+                output["summary_path"] = "llm"
+
+        return output
+
+    async def aexecution_stream(self, prompt=None, context_summary=None, batch_size=RESULT_FETCH_BATCH, include_context=False):
+        # Async counterpart of execution_stream. Rows are read through a
+        # server-side cursor on the async engine but buffered (the row cap
+        # bounds them) so the connection and the database semaphore are
+        # released before a slow client reads them; summary tokens come
+        # through a queue for the same reason.
+        try:
+            generated = await self.agenerate_sql(prompt, context_summary)
+            query_sql = generated["query_sql"]
+            yield "sql", {"query_sql": query_sql, "query_params": generated.get("query_params"), "sql_cache": sql_cache_outcome(generated),
+                          "sql_template": generated.get("sql_template"), "prompt_tokens": generated.get("prompt_tokens")}
+
+            chunks = []
+            fetch = BoundedFetch(query_sql, params=generated.get("query_params"), batch_size=batch_size)
+            table = await asyncio.to_thread(self.read_replica, fetch) if self.replica is not None else None
+            if table is not None:
+                for chunk in fetch.arrow_chunks(table):
+                    chunks.append(chunk)
+                    yield "rows", chunk
+            else:
+                async with self.db_semaphore:
+                    async with self.async_engine.connect() as conn:
+                        fetch.guard = await self.aguard_sql(conn, query_sql, fetch.max_rows, fetch.params)
+                        chunks = [chunk async for chunk in fetch.achunks(conn)]
+                for chunk in chunks:
+                    yield "rows", chunk
+            await self.aremember_sql(generated)
+
+            query_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            RESULT_ROWS.observe(len(query_df))
+            if not query_df.empty:
+                if use_fast_summary(query_df, extract_question(prompt), fetch.truncated):
+                    yield "summary", self.__fast_summary(query_df, fetch.total_count)
+                    yield "summary_path", "rule"
+                else:
+                    tokens = []
+                    inputs = self.summary_inputs(query_df, prompt, fetch.total_count)
+                    async for token in self.__astream_summary(inputs):
+                        tokens.append(token)
+                        yield "summary", token
+                    self.__record_llm_summary("".join(tokens))
+                    yield "summary_path", "llm"
+                if include_context:
+                    yield "context", self.__generate_context_summary(query_df)
+            yield "done", fetch.info()
+
+        except Exception as error:
+            yield "error", {"error": str(error)}
+
+    async def __astream_summary(self, inputs):
+        # The model streams into a queue while it holds the LLM semaphore, so
+        # the slot is freed when generation ends, not when the client has read
+        # every token. Leaving early cancels the generation.
+        tokens = asyncio.Queue()
+
+        async def produce():
+            try:
+                async with self.llm_semaphore:
+                    with timed("summary_llm"):
+                        async for token in self.summary_model.astream(inputs):
+                            tokens.put_nowait((token, None))
+                tokens.put_nowait((None, None))
+            except Exception as error:
+                tokens.put_nowait((None, error))
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                token, error = await tokens.get()
+                if error is not None:
+                    raise error
+                if token is None:
+                    return
+                yield token
+        finally:
+            producer.cancel()
+
+    def batch_execution(self, prompts, max_concurrency=BATCH_CONCURRENCY):
+        # One output per prompt, in order. SQL for cache misses is generated
+        # through the chain's batch interface, then the queries run on a
+        # thread pool sharing the engine's connection pool.
+        lookups = []
+        for prompt in prompts:
+            try:
+                lookups.append(self.__lookup_sql(prompt, None))
+            except Exception as error:
+                lookups.append(error)
+        misses = [i for i, lookup in enumerate(lookups) if not isinstance(lookup, Exception) and lookup[2] is not None]
+        if misses:
+            with timed("sql_generation_batch"):
+                responses = lookups[misses[0]][1].batch(
+                    [lookups[i][2] for i in misses], config={"max_concurrency": max_concurrency}, return_exceptions=True
+                )
+            for i, response in zip(misses, responses):
+                try:
+                    if isinstance(response, Exception):
+                        raise response
+                    lookups[i][0]["query_sql"] = self.__clean_sql(response)
+                except Exception as error:
+                    lookups[i] = error
+
+        def run(i):
+            if isinstance(lookups[i], Exception):
+                return {"error": str(lookups[i])}
+            try:
+                return self.__run_generated(prompts[i], lookups[i][0])
+            except Exception as error:
+                return {"error": str(error)}
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            return list(pool.map(run, range(len(prompts))))
+
+    async def abatch_execution(self, prompts, max_concurrency=BATCH_CONCURRENCY):
+        # Yields (position, output) as each prompt finishes, so a slow one
+        # does not hold back the rest: every SQL that comes back from the
+        # batched generation starts its query straight away.
+        results = asyncio.Queue()
+        limit = asyncio.Semaphore(max_concurrency)
+        running = {}  # position -> task running its query
+
+        async def run(position, generated):
+            try:
+                async with limit:
+                    output = await self.__arun_generated(prompts[position], generated)
+            except Exception as error:
+                output = {"error": str(error)}
+            results.put_nowait((position, output))
+
+        async def generate():
+            misses = []
+            for position, prompt in enumerate(prompts):
+                try:
+                    generated, sql_model, inputs = await self.__alookup_sql(prompt, None)
+                except Exception as error:
+                    results.put_nowait((position, {"error": str(error)}))
+                    continue
+                if inputs is None:
+                    running[position] = asyncio.create_task(run(position, generated))
+                else:
+                    misses.append((position, generated, sql_model, inputs))
+            if not misses:
+                return
+            with timed("sql_generation_batch"):
+                async for i, response in misses[0][2].abatch_as_completed(
+                    [miss[3] for miss in misses], config={"max_concurrency": max_concurrency}, return_exceptions=True
+                ):
+                    position, generated = misses[i][:2]
+                    try:
+                        if isinstance(response, Exception):
+                            raise response
+                        generated["query_sql"] = self.__clean_sql(response)
+                    except Exception as error:
+                        results.put_nowait((position, {"error": str(error)}))
+                        continue
+                    running[position] = asyncio.create_task(run(position, generated))
+
+        producer = asyncio.create_task(generate())
+        pending = set(range(len(prompts)))
+        getter = None
+        try:
+            while pending:
+                if not producer.done():
+                    # Waits on the producer too, so a failure in generate() cannot leave this hanging
+                    getter = asyncio.ensure_future(results.get())
+                    await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    position, output = getter.result()
+                elif results.empty() and producer.exception() is not None and pending - running.keys():
+                    # generate() failed: prompts whose query never started get its error
+                    position, output = min(pending - running.keys()), {"error": str(producer.exception())}
+                else:
+                    position, output = await results.get()
+                pending.discard(position)
+                yield position, output
+        finally:
+            if getter is not None:
+                getter.cancel()
+            producer.cancel()
+            for task in running.values():
+                task.cancel()
+
     def __generate_context_summary(self, df: pd.DataFrame):
-        if df.empty:
-            return ""
-
-        summary_parts = [f"Total records: {len(df)}"]
-        id_col = "po_id" if "po_id" in df.columns else "purchase_order_id" if "purchase_order_id" in df.columns else None
-
-        if id_col:
-            for po_id in df[id_col].unique()[:50]:  # Limit to 50 POs for performance
-                po_data = df[df[id_col] == po_id].iloc[0]
-                po_summary = [f"For Purchase Order ID: {po_id}"]
-                formatted_row = [
-                    f"  {col.replace('_', ' ').title()}: "
-                    f"{pd.Timestamp(po_data[col]).strftime('%Y-%m-%d') if pd.notnull(po_data[col]) else 'null'}"
-                    if "date" in col.lower()
-                    else f"  {col.replace('_', ' ').title()}: {f'{po_data[col]:,.2f}'.replace(',', ',') if pd.notnull(po_data[col]) else 'null'}"
-                    if df[col].dtype in ["int64", "float64"]
-                    else f"  {col.replace('_', ' ').title()}: {po_data[col] if pd.notnull(po_data[col]) else 'null'}"
-                    for col in df.columns
-                ]
-                po_summary.extend(formatted_row)
-                summary_parts.append("\n".join(po_summary))
-        else:
-            max_rows = 50  # Reduced for performance
-            for idx, row in df.head(max_rows).iterrows():
-                formatted_row = [
-                    f"{col.replace('_', ' ').title()}: "
-                    f"{pd.Timestamp(row[col]).strftime('%Y-%m-%d') if pd.notnull(row[col]) else 'null'}"
-                    if "date" in col.lower()
-                    else f"{col.replace('_', ' ').title()}: {f'{row[col]:,.2f}'.replace(',', ',') if pd.notnull(row[col]) else 'null'}"
-                    if df[col].dtype in ["int64", "float64"]
-                    else f"{col.replace('_', ' ').title()}: {row[col] if pd.notnull(row[col]) else 'null'}"
-                    for col in df.columns
-                ]
-                summary_parts.append(f"Row {idx+1}: {', '.join(formatted_row)}")
-            if len(df) > max_rows:
-                summary_parts.append(f"... (showing first {max_rows} of {len(df)} rows)")
-
-        return "\n".join(summary_parts)
\ No newline at end of file
+        with timed("context_summary"):
+            return build_context_summary(df)
@@ -0,0 +1,124 @@
+# metrics.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Metrics are kept per worker process; every sample carries the worker pid so
+# scrapes from different uvicorn workers can be told apart and summed.
+WORKER = str(os.getpid())
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(key + (('worker', WORKER),))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                labels = key + (("worker", WORKER),)
+                for bound, count in zip(self.buckets, state):
+                    lines.append(f"{self.name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {state[-1]}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {state[-2]}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {state[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "nlp2sql_stage_seconds",
+    "Time spent in each stage of answering a question",
+    ("stage",)
+)
+RESULT_ROWS = Histogram("nlp2sql_result_rows", "Rows returned per question", buckets=ROW_BUCKETS)
+LLM_TOKENS = Histogram(
+    "nlp2sql_llm_tokens",
+    "Estimated tokens per LLM call",
+    ("call", "direction"),
+    buckets=TOKEN_BUCKETS
+)
+SQL_CACHE_LOOKUPS = Counter("nlp2sql_sql_cache_lookups_total", "SQL translation cache lookups", ("outcome",))
+SUMMARY_PATHS = Counter("nlp2sql_summary_total", "Summaries produced, by path", ("path",))
+REQUESTS = Counter("nlp2sql_requests_total", "Handled requests", ("endpoint", "outcome"))
+COALESCED_REQUESTS = Counter(
+    "nlp2sql_coalesced_requests_total",
+    "Questions by single-flight role: leader, coalesced, overflow or timeout",
+    ("outcome",)
+)
+SQL_GUARD_CHECKS = Counter(
+    "nlp2sql_sql_guard_total",
+    "Pre-execution checks of generated SQL: ok, limited, rejected, invalid or unplanned",
+    ("outcome",)
+)
+QUERY_TEMPLATES = Counter(
+    "nlp2sql_query_templates_total",
+    "Question template lookups and changes: matched, unmatched, registered or promoted",
+    ("outcome",)
+)
+REPLICA_QUERIES = Counter(
+    "nlp2sql_replica_queries_total",
+    "Queries offered to the analytics replica: served, skipped (not an aggregate), stale or fallback",
+    ("outcome",)
+)
+
+REGISTRY = [STAGE_SECONDS, RESULT_ROWS, LLM_TOKENS, SQL_CACHE_LOOKUPS, SUMMARY_PATHS, REQUESTS, COALESCED_REQUESTS, SQL_GUARD_CHECKS,
+            QUERY_TEMPLATES, REPLICA_QUERIES]
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
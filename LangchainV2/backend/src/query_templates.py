@@ -0,0 +1,343 @@
+# query_templates.py
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import sqlalchemy as sql
+import sqlglot
+from sqlglot.tokens import TokenType
+from src.metrics import QUERY_TEMPLATES
+from src.sql_guard import SQLGLOT_DIALECTS
+
+QUERY_TEMPLATES_ENABLED = os.getenv("QUERY_TEMPLATES_ENABLED", "true").lower() == "true"
+QUERY_TEMPLATES_PATH = os.getenv("QUERY_TEMPLATES_PATH", os.path.join(tempfile.gettempdir(), "nlp2sql_templates.db"))
+QUERY_TEMPLATES_FILE = os.getenv("QUERY_TEMPLATES_FILE")  # Optional JSON list of templates registered at startup
+TEMPLATE_AUTO_PROMOTE = os.getenv("TEMPLATE_AUTO_PROMOTE", "true").lower() == "true"
+TEMPLATE_PROMOTE_AFTER = int(os.getenv("TEMPLATE_PROMOTE_AFTER", "3"))  # successful runs with distinct slot values
+TEMPLATE_RELOAD_INTERVAL = int(os.getenv("TEMPLATE_RELOAD_INTERVAL", "30"))  # seconds between store re-reads
+
+MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+# Question text each slot type accepts; "name" is free text up to the next literal
+SLOT_REGEX = {
+    "date": rf"\d{{4}}-\d{{1,2}}-\d{{1,2}}|\d{{1,2}}[-/]\d{{1,2}}[-/]\d{{4}}|\d{{1,2}} {MONTHS},? \d{{4}}|{MONTHS} \d{{1,2}},? \d{{4}}",
+    "number": r"\d+(?:\.\d+)?",
+    "quoted": r"\"[^\"]+\"|'[^']+'",
+    "name": r".+?",
+}
+SLOT_PATTERN = re.compile(r"\{(\w+):(" + "|".join(SLOT_REGEX) + r")\}")
+
+# Day-first, like the DD-MM-YYYY strings in the upeg tables
+DATE_FORMATS = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d %B %Y", "%d %b %Y", "%B %d %Y", "%b %d %Y"]
+
+def clean_question(text):
+    # Same as normalize_question; slot values keep their case
+    return re.sub(r"\s+", " ", text or "").strip().rstrip("?.!; ")
+
+def parse_date(text):
+    # (date, format it was written in), or None
+    text = re.sub(r"\s+", " ", text.replace(",", " ").replace(".", " ")).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date(), date_format
+        except ValueError:
+            continue
+    return None
+
+def slot_value(slot_type, text, date_format=None):
+    if slot_type == "number":
+        return float(text) if "." in text else int(text)
+    if slot_type == "date":
+        parsed = parse_date(text)
+        if parsed is None:
+            raise ValueError(f"Not a date: {text}")
+        return parsed[0].strftime(date_format) if date_format else parsed[0]
+    if slot_type == "quoted":
+        return text[1:-1]
+    return text.strip()
+
+def bind_names(query_sql):
+    return set(sql.text(query_sql).compile().params)
+
+# A parameterized SELECT for one question shape, e.g.
+#   pattern: top {limit:number} purchase orders by amount after {after:date}
+#   sql:     SELECT ... WHERE TO_DATE(po_date, 'DD-MM-YYYY') > :after ... LIMIT :limit
+# Slot values are bound as parameters, never spliced into the SQL text.
+class QueryTemplate:
+    def __init__(self, pattern, query_sql, formats=None, source="manual", fingerprint=None):
+        self.pattern = clean_question(pattern)
+        self.query_sql = query_sql.strip()
+        self.formats = formats or {}  # slot -> strftime format for date slots bound as strings
+        self.source = source
+        self.fingerprint = fingerprint
+        self.slots = SLOT_PATTERN.findall(self.pattern)
+
+        names = [name for name, _ in self.slots]
+        if len(set(names)) != len(names):
+            raise ValueError("Template pattern repeats a slot name")
+        if set(names) != bind_names(self.query_sql):
+            raise ValueError(f"Template slots {sorted(names)} do not match the SQL parameters {sorted(bind_names(self.query_sql))}")
+
+        parts = SLOT_PATTERN.split(self.pattern)
+        regex = []
+        for i in range(0, len(parts), 3):
+            regex.append(r"\s+".join(re.escape(word) for word in parts[i].split(" ")))
+            if i + 1 < len(parts):
+                regex.append(f"(?P<{parts[i + 1]}>{SLOT_REGEX[parts[i + 2]]})")
+        try:
+            self.regex = re.compile("^" + "".join(regex) + "$", re.IGNORECASE)
+        except re.error as error:
+            raise ValueError(f"Invalid template pattern: {error}")
+        # Literal words of the pattern; a question missing any of them is skipped without running the regex
+        self.tokens = set(re.findall(r"\w+", SLOT_PATTERN.sub(" ", self.pattern).lower()))
+
+    def match(self, question, words):
+        if not self.tokens <= words:
+            return None
+        found = self.regex.match(question)
+        if found is None:
+            return None
+        try:
+            return {name: slot_value(slot_type, found.group(name), self.formats.get(name)) for name, slot_type in self.slots}
+        except ValueError:
+            return None
+
+    def info(self):
+        return {"pattern": self.pattern, "sql": self.query_sql, "formats": self.formats, "source": self.source}
+
+def derive_template(question, query_sql, dialect):
+    # Turns a question and the SQL generated for it into (pattern, sql,
+    # formats, values) by replacing each number, date and quoted name in the
+    # question, and the one SQL literal carrying the same value, with a slot.
+    # None when the question has no such values or they cannot be matched
+    # one-to-one with literals in the SQL.
+    text = clean_question(question)
+    spans = []
+    for slot_type in ("quoted", "date", "number"):
+        for found in re.finditer(rf"(?<![\w.])(?:{SLOT_REGEX[slot_type]})(?![\w])", text, re.IGNORECASE):
+            if not any(found.start() < end and start < found.end() for start, end, _, _ in spans):
+                spans.append((found.start(), found.end(), slot_type, slot_value(slot_type, found.group())))
+    if not spans:
+        return None
+    spans.sort()
+
+    counts = {}
+    slots = []
+    for start, end, slot_type, value in spans:
+        counts[slot_type] = counts.get(slot_type, 0) + 1
+        slots.append((f"{slot_type}_{counts[slot_type]}", slot_type, value))
+
+    try:
+        tokens = sqlglot.Dialect.get_or_raise(SQLGLOT_DIALECTS.get(dialect)).tokenize(query_sql)
+    except sqlglot.errors.SqlglotError:
+        return None
+    replacements, formats = [], {}
+    for token in tokens:
+        if token.token_type not in (TokenType.NUMBER, TokenType.STRING):
+            continue
+        matches = []
+        for name, slot_type, value in slots:
+            if slot_type == "number" and token.token_type == TokenType.NUMBER:
+                if re.fullmatch(SLOT_REGEX["number"], token.text) and slot_value("number", token.text) == value:
+                    matches.append((name, None))
+            elif slot_type == "quoted" and token.token_type == TokenType.STRING:
+                if token.text == value:
+                    matches.append((name, None))
+            elif slot_type == "date" and token.token_type == TokenType.STRING:
+                parsed = parse_date(token.text)
+                if parsed is not None and parsed[0] == value:
+                    matches.append((name, parsed[1]))
+        if len(matches) > 1:
+            return None  # Two slots with the same value: cannot tell which literal is which
+        if matches:
+            name, date_format = matches[0]
+            if any(used == name for _, _, used in replacements):
+                # The value appears as two literals ("top 10" with "> 10 ... LIMIT 10"):
+                # one slot would tie them together on every later match
+                return None
+            if date_format:
+                if formats.get(name, date_format) != date_format:
+                    return None
+                formats[name] = date_format
+            replacements.append((token.start, token.end + 1, name))
+    if {name for name, _, _ in slots} != {name for _, _, name in replacements}:
+        return None  # A question value the SQL does not use as a literal
+
+    template_sql = query_sql
+    for start, end, name in sorted(replacements, reverse=True):
+        template_sql = f"{template_sql[:start]}:{name}{template_sql[end:]}"
+    pattern = text
+    for (start, end, _, _), (name, slot_type, _) in sorted(zip(spans, slots), reverse=True):
+        pattern = f"{pattern[:start]}{{{name}:{slot_type}}}{pattern[end:]}"
+    values = {name: value.isoformat() if slot_type == "date" else value for name, slot_type, value in slots}
+    return pattern, template_sql, formats, values
+
+# Verified templates in a SQLite file shared by all workers. Templates are
+# registered by an admin or promoted automatically once generated SQL of the
+# same shape has run successfully for enough distinct slot values. Each
+# worker matches against an in-memory copy, re-read every reload_interval.
+class QueryTemplateStore:
+    def __init__(self, path=QUERY_TEMPLATES_PATH, promote_after=TEMPLATE_PROMOTE_AFTER,
+                 reload_interval=TEMPLATE_RELOAD_INTERVAL):
+        self.path = path
+        self.promote_after = promote_after
+        self.reload_interval = reload_interval
+        self.fingerprint = None
+        self._templates = []
+        self._hits = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.__init_store()
+
+    def match(self, question):
+        if time.time() - self._loaded_at > self.reload_interval:
+            self.__reload()
+        question = clean_question(question)
+        words = set(re.findall(r"\w+", question.lower()))
+        for template in self._templates:
+            params = template.match(question, words)
+            if params is not None:
+                with self._lock:
+                    self._hits[template.pattern] = self._hits.get(template.pattern, 0) + 1
+                QUERY_TEMPLATES.inc(outcome="matched")
+                return template, params
+        QUERY_TEMPLATES.inc(outcome="unmatched")
+        return None
+
+    def add(self, template):
+        with self.__connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_templates VALUES (?, ?, ?, ?, ?, ?)",
+                (template.pattern, template.query_sql, json.dumps(template.formats), template.source, template.fingerprint, time.time())
+            )
+        QUERY_TEMPLATES.inc(outcome="registered" if template.source == "manual" else "promoted")
+        self.__reload()
+
+    def remove(self, pattern):
+        with self.__connect() as conn:
+            removed = conn.execute("DELETE FROM query_templates WHERE pattern = ?", (clean_question(pattern),)).rowcount
+        self.__reload()
+        return removed > 0
+
+    def list_templates(self):
+        if time.time() - self._loaded_at > self.reload_interval:
+            self.__reload()
+        with self._lock:
+            return [{**template.info(), "hits": self._hits.get(template.pattern, 0)} for template in self._templates]
+
+    def observe(self, question, query_sql, dialect, fingerprint):
+        # Called after generated SQL ran successfully. The candidate for this
+        # question shape is reset whenever the model writes different SQL for
+        # it, so only shapes that translate consistently get promoted.
+        derived = derive_template(question, query_sql, dialect)
+        if derived is None:
+            return None
+        pattern, template_sql, formats, values = derived
+        seen_key = json.dumps(values, sort_keys=True)
+        try:
+            with self.__connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("SELECT 1 FROM query_templates WHERE pattern = ?", (pattern,)).fetchone():
+                    return None
+                row = conn.execute(
+                    "SELECT sql, fingerprint, seen FROM template_candidates WHERE pattern = ?", (pattern,)
+                ).fetchone()
+                seen = json.loads(row[2]) if row and row[0] == template_sql and row[1] == fingerprint else []
+                if seen_key not in seen:
+                    seen.append(seen_key)
+                if len(seen) < self.promote_after:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO template_candidates VALUES (?, ?, ?, ?, ?)",
+                        (pattern, template_sql, fingerprint, json.dumps(seen), time.time())
+                    )
+                    return None
+                template = QueryTemplate(pattern, template_sql, formats, source="promoted", fingerprint=fingerprint)
+                conn.execute("DELETE FROM template_candidates WHERE pattern = ?", (pattern,))
+        except (sqlite3.Error, ValueError) as error:
+            logging.warning("Template candidate update failed: %s", error)
+            return None
+        logging.info("Question template promoted: %s", pattern)
+        self.add(template)
+        return template
+
+    def set_fingerprint(self, fingerprint):
+        # Promoted templates were verified against one schema; registered
+        # ones carry no fingerprint and are kept across schema changes.
+        if fingerprint == self.fingerprint:
+            return
+        self.fingerprint = fingerprint
+        with self.__connect() as conn:
+            conn.execute("DELETE FROM query_templates WHERE fingerprint IS NOT NULL AND fingerprint != ?", (fingerprint,))
+            conn.execute("DELETE FROM template_candidates WHERE fingerprint != ?", (fingerprint,))
+        self.__reload()
+
+    def __reload(self):
+        try:
+            with self.__connect() as conn:
+                rows = conn.execute("SELECT pattern, sql, formats, source, fingerprint FROM query_templates").fetchall()
+        except sqlite3.Error as error:
+            logging.warning("Template store read failed: %s", error)
+            self._loaded_at = time.time()
+            return
+        templates = []
+        for pattern, query_sql, formats, source, fingerprint in rows:
+            if fingerprint is not None and self.fingerprint is not None and fingerprint != self.fingerprint:
+                continue
+            try:
+                templates.append(QueryTemplate(pattern, query_sql, json.loads(formats), source, fingerprint))
+            except ValueError as error:
+                logging.warning("Skipping template %r: %s", pattern, error)
+        # Registered templates first, then the most specific (most literal words)
+        templates.sort(key=lambda template: (template.source != "manual", -len(template.tokens)))
+        with self._lock:
+            self._templates = templates
+            self._loaded_at = time.time()
+
+    @contextmanager
+    def __connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def __init_store(self):
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_templates (
+                    pattern TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    formats TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    fingerprint TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS template_candidates (
+                    pattern TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    seen TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+def load_template_file(path=QUERY_TEMPLATES_FILE):
+    # [{"pattern": "...", "sql": "...", "formats": {"slot": "%d-%m-%Y"}}, ...]
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as template_file:
+        return json.load(template_file)
@@ -0,0 +1,34 @@
+# request_log.py
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))  # Share of requests logged in detail
+
+LOG_FORMAT = "%(asctime)s — %(name)s — %(levelname)s — %(message)s"
+
+_listener = None
+
+def configure_logging():
+    # Handlers write to stdout from a background thread; request code only
+    # puts records on an in-memory queue and never blocks on the stream.
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def sampled():
+    return random.random() < LOG_SAMPLE_RATE
@@ -0,0 +1,172 @@
+# result_fetch.py
+import logging
+import os
+import time
+import pandas as pd
+import sqlalchemy as sql
+import sqlglot
+from sqlglot.tokens import TokenType
+from src.metrics import timed, STAGE_SECONDS
+
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "5000"))
+RESULT_FETCH_BATCH = int(os.getenv("RESULT_FETCH_BATCH", "500"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("STATEMENT_TIMEOUT_MS", "30000"))
+RESULT_COUNT_TOTAL = os.getenv("RESULT_COUNT_TOTAL", "true").lower() == "true"
+RESULT_COUNT_TIMEOUT_MS = int(os.getenv("RESULT_COUNT_TIMEOUT_MS", "5000"))
+
+def records_to_dataframe(rows, columns):
+    # Mirrors pd.read_sql_query, which coerces Decimal values to float
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+def strip_statement(query_sql):
+    # Cuts the SQL after its last token, dropping trailing semicolons and
+    # comments: a trailing "-- comment" would otherwise comment out the
+    # wrapper's closing parenthesis
+    try:
+        tokens = [token for token in sqlglot.tokenize(query_sql) if token.token_type != TokenType.SEMICOLON]
+    except sqlglot.errors.SqlglotError:
+        return query_sql.strip().rstrip(";").strip()
+    if not tokens:
+        return query_sql.strip()
+    return query_sql[:tokens[-1].end + 1].strip()
+
+def bounded_sql(query_sql, max_rows):
+    # One extra row tells us whether the cap cut the result short
+    return f"SELECT * FROM (\n{strip_statement(query_sql)}\n) AS bounded_result LIMIT {max_rows + 1}"
+
+def count_sql(query_sql):
+    return f"SELECT COUNT(*) FROM (\n{strip_statement(query_sql)}\n) AS counted_result"
+
+# Reads generated SQL through a server-side cursor, in batches, never keeping
+# more than max_rows rows however the model wrote the query.
+class BoundedFetch:
+    def __init__(self, query_sql, max_rows=RESULT_MAX_ROWS, batch_size=RESULT_FETCH_BATCH,
+                 timeout_ms=STATEMENT_TIMEOUT_MS, count_total=RESULT_COUNT_TOTAL, params=None):
+        self.query_sql = query_sql
+        self.params = params or {}  # Bound parameters, for SQL from a question template
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.timeout_ms = timeout_ms
+        self.count_total = count_total
+        self.columns = []
+        self.row_count = 0
+        self.truncated = False
+        self.total_count = None
+        self.guard = None  # Verdict of the SQL guard, set by the caller
+        self.backend = "database"  # or "replica" when the analytics replica answered
+
+    def info(self):
+        return {
+            "sql_guard": self.guard,
+            "backend": self.backend,
+            "row_count": self.row_count,
+            "truncated": self.truncated,
+            "total_count": self.total_count if self.truncated else self.row_count
+        }
+
+    def chunks(self, conn):
+        with timed("db_execution"):
+            self.__set_timeout(conn, self.timeout_ms)
+            result = conn.execution_options(stream_results=True, max_row_buffer=self.batch_size).execute(
+                sql.text(bounded_sql(self.query_sql, self.max_rows)), self.params
+            )
+        self.columns = list(result.keys())
+        # Only time spent pulling rows counts; time the consumer holds each chunk does not
+        fetch_seconds = 0.0
+        try:
+            started = time.perf_counter()
+            for partition in result.partitions(self.batch_size):
+                rows = self.__take(partition)
+                frame = records_to_dataframe(rows, self.columns) if rows else None
+                fetch_seconds += time.perf_counter() - started
+                if frame is not None:
+                    yield frame
+                if self.truncated:
+                    break
+                started = time.perf_counter()
+        finally:
+            result.close()
+            STAGE_SECONDS.observe(fetch_seconds, stage="row_fetch")
+        if self.truncated and self.count_total:
+            self.__set_timeout(conn, RESULT_COUNT_TIMEOUT_MS)
+            try:
+                with timed("total_count"):
+                    self.total_count = conn.execute(sql.text(count_sql(self.query_sql)), self.params).scalar()
+            except Exception as error:
+                logging.warning("Total count unavailable: %s", error)
+
+    async def achunks(self, conn):
+        with timed("db_execution"):
+            await self.__aset_timeout(conn, self.timeout_ms)
+            result = await conn.stream(sql.text(bounded_sql(self.query_sql, self.max_rows)), self.params)
+        self.columns = list(result.keys())
+        fetch_seconds = 0.0
+        try:
+            started = time.perf_counter()
+            async for partition in result.partitions(self.batch_size):
+                rows = self.__take(partition)
+                frame = records_to_dataframe(rows, self.columns) if rows else None
+                fetch_seconds += time.perf_counter() - started
+                if frame is not None:
+                    yield frame
+                if self.truncated:
+                    break
+                started = time.perf_counter()
+        finally:
+            await result.close()
+            STAGE_SECONDS.observe(fetch_seconds, stage="row_fetch")
+        if self.truncated and self.count_total:
+            await self.__aset_timeout(conn, RESULT_COUNT_TIMEOUT_MS)
+            try:
+                with timed("total_count"):
+                    self.total_count = (await conn.execute(sql.text(count_sql(self.query_sql)), self.params)).scalar()
+            except Exception as error:
+                logging.warning("Total count unavailable: %s", error)
+
+    def arrow_chunks(self, table):
+        # Result already read from the analytics replica as an Arrow table;
+        # converted column-wise, batch_size rows per DataFrame
+        for batch in self.__take_arrow(table).to_batches(max_chunksize=self.batch_size):
+            yield batch.to_pandas()
+
+    def from_arrow(self, table):
+        return self.__take_arrow(table).to_pandas()
+
+    def fetch_all(self, conn):
+        return self.__combine(list(self.chunks(conn)))
+
+    async def afetch_all(self, conn):
+        return self.__combine([chunk async for chunk in self.achunks(conn)])
+
+    def __take_arrow(self, table):
+        self.backend = "replica"
+        self.columns = list(table.column_names)
+        if table.num_rows > self.max_rows:
+            self.truncated = True
+            table = table.slice(0, self.max_rows)
+        self.row_count = table.num_rows
+        return table
+
+    def __take(self, partition):
+        remaining = self.max_rows - self.row_count
+        if len(partition) > remaining:
+            self.truncated = True
+            partition = partition[:remaining]
+        self.row_count += len(partition)
+        return partition
+
+    def __combine(self, chunks):
+        if not chunks:
+            return records_to_dataframe([], self.columns)
+        return pd.concat(chunks, ignore_index=True)
+
+    # SET LOCAL only lasts for the current transaction, so pooled connections
+    # go back without a lingering timeout. Other dialects (SQLite in local
+    # runs) have no statement_timeout and are left alone.
+    def __set_timeout(self, conn, timeout_ms):
+        if timeout_ms and conn.dialect.name == "postgresql":
+            conn.execute(sql.text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+    async def __aset_timeout(self, conn, timeout_ms):
+        if timeout_ms and conn.dialect.name == "postgresql":
+            await conn.execute(sql.text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
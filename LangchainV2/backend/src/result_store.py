@@ -0,0 +1,83 @@
+# result_store.py
+import base64
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+import pyarrow as pa
+
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", os.path.join(tempfile.gettempdir(), "nlp2sql_results"))
+RESULT_STORE_TTL = int(os.getenv("RESULT_STORE_TTL", "1800"))  # seconds
+RESULT_STORE_CLEANUP_INTERVAL = int(os.getenv("RESULT_STORE_CLEANUP_INTERVAL", "300"))  # seconds
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "200"))
+
+QUERY_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["o"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+# Spills full result sets to Arrow IPC files so later pages are served from
+# disk (memory-mapped) without calling the LLM or re-running the query. The
+# directory is shared, so any worker can serve a page.
+class ResultStore:
+    def __init__(self, directory=RESULT_STORE_DIR, ttl=RESULT_STORE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def save(self, df):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+            logging.warning("Result could not be spilled to Arrow: %s", error)
+            return None
+        query_id = uuid.uuid4().hex
+        path = self.__path(query_id)
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return query_id
+
+    def page(self, query_id, offset, limit):
+        if not QUERY_ID_PATTERN.match(query_id):
+            raise KeyError(query_id)
+        path = self.__path(query_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                raise KeyError(query_id)
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+                return table.slice(offset, limit).to_pandas(), table.num_rows
+        except FileNotFoundError:
+            raise KeyError(query_id)
+
+    def cleanup(self):
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # Already removed by another worker
+        return removed
+
+    def __path(self, query_id):
+        return os.path.join(self.directory, f"{query_id}.arrow")
@@ -0,0 +1,129 @@
+# schema_index.py
+import math
+import os
+import re
+from collections import Counter
+
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "true").lower() == "true"
+SCHEMA_PRUNE_MAX_TABLES = int(os.getenv("SCHEMA_PRUNE_MAX_TABLES", "3"))
+SCHEMA_PRUNE_MIN_RATIO = float(os.getenv("SCHEMA_PRUNE_MIN_RATIO", "0.25"))  # of the best table's score
+# Below this best score no table matched a distinctive word (every upeg table
+# is purchase_order_*, so "orders" alone scores near zero): send the full schema
+SCHEMA_PRUNE_MIN_SCORE = float(os.getenv("SCHEMA_PRUNE_MIN_SCORE", "1.0"))
+# A table left out scoring this close to the best one makes the cut arbitrary: send the full schema
+SCHEMA_PRUNE_TIE_RATIO = float(os.getenv("SCHEMA_PRUNE_TIE_RATIO", "0.9"))
+# Tables always sent with a pruned schema
+SCHEMA_PRUNE_ALWAYS = [table.strip() for table in os.getenv("SCHEMA_PRUNE_ALWAYS", "purchase_order_main").split(",") if table.strip()]
+
+# The purchase order id is po_id on some upeg tables and purchase_order_id on
+# others; treat the two as the same join key.
+PO_ID_COLUMNS = ("po_id", "purchase_order_id")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def estimate_tokens(text):
+    # Rough local estimate (~4 characters per token) so counting never calls the API
+    return math.ceil(len(text) / 4)
+
+def extract_question(prompt):
+    # The API formats the question into the long instruction PROMPT; only the
+    # question itself is useful for ranking tables.
+    return prompt.rsplit("Question:", 1)[-1].strip()
+
+def tokenize(text):
+    tokens = []
+    for word in re.split(r"[^0-9a-zA-Z]+", (text or "").lower()):
+        if not word:
+            continue
+        if len(word) > 4 and re.search(r"(?:ch|sh|x|z|ss|us)es$", word):
+            word = word[:-2]  # boxes, addresses, statuses
+        elif len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+            word = word[:-1]  # orders, tolerances
+        tokens.append(word)
+    return tokens
+
+# Local index over the reflected schema: table/column names and comments are
+# ranked against each question with BM25 so only the relevant tables (and
+# their join keys) go into the SQL-generation prompt. Table info, including
+# the sample rows, is rendered once here instead of on every request.
+class SchemaIndex:
+    def __init__(self, db):
+        self.tables = sorted(db.get_usable_table_names())
+        self.table_info = {table: db.get_table_info([table]) for table in self.tables}
+        metadata = {table.name: table for table in db._metadata.sorted_tables if table.name in self.tables}
+        self.documents = {name: self.__document(metadata[name]) for name in self.tables if name in metadata}
+        self.join_keys = self.__join_keys(metadata)
+        self.term_counts = {table: Counter(terms) for table, terms in self.documents.items()}
+        self.doc_freq = Counter(term for terms in self.documents.values() for term in set(terms))
+        self.avg_length = sum(len(terms) for terms in self.documents.values()) / max(len(self.documents), 1)
+        self.full_info = self.render(self.tables)
+        self.full_tokens = estimate_tokens(self.full_info)
+
+    def rank(self, text):
+        terms = set(tokenize(text))
+        total = len(self.documents)
+        scores = []
+        for table, document in self.documents.items():
+            counts = self.term_counts[table]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(document) / self.avg_length)
+            score = 0.0
+            for term in terms:
+                freq = counts.get(term)
+                if not freq:
+                    continue
+                idf = math.log(1 + (total - self.doc_freq[term] + 0.5) / (self.doc_freq[term] + 0.5))
+                score += idf * freq * (BM25_K1 + 1) / (freq + norm)
+            scores.append((table, score))
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    def select(self, text, max_tables=SCHEMA_PRUNE_MAX_TABLES, min_ratio=SCHEMA_PRUNE_MIN_RATIO,
+               min_score=SCHEMA_PRUNE_MIN_SCORE, tie_ratio=SCHEMA_PRUNE_TIE_RATIO, always=SCHEMA_PRUNE_ALWAYS):
+        # None means "no confident match": the caller falls back to the full schema
+        ranked = self.rank(text)
+        if not ranked or ranked[0][1] <= 0 or ranked[0][1] < min_score:
+            return None
+        best = ranked[0][1]
+        if len(ranked) > max_tables and ranked[max_tables][1] >= best * tie_ratio:
+            return None
+        tables = [table for table, score in ranked[:max_tables] if score >= best * min_ratio]
+        return tables + [table for table in always if table in self.documents and table not in tables]
+
+    def render(self, tables):
+        info = "\n\n".join(self.table_info[table] for table in tables if table in self.table_info)
+        joins = [
+            f"{left}.{left_col} = {right}.{right_col}"
+            for left, left_col, right, right_col in self.join_keys
+            if left in tables and right in tables
+        ]
+        if joins:
+            info += "\n\nJoin keys:\n" + "\n".join(joins)
+        return info
+
+    def __document(self, table):
+        # Table name tokens are repeated so a table-name hit outweighs a single column hit
+        terms = tokenize(table.name) * 3 + tokenize(table.comment)
+        for column in table.columns:
+            terms += tokenize(column.name) + tokenize(column.comment)
+        return terms
+
+    def __join_keys(self, metadata):
+        keys = set()
+        for table in metadata.values():
+            for fk in table.foreign_keys:
+                if fk.column.table.name in metadata:
+                    keys.add((table.name, fk.parent.name, fk.column.table.name, fk.column.name))
+        # Shared *_id columns and the two spellings of the purchase order id
+        names = sorted(metadata)
+        for i, left in enumerate(names):
+            left_cols = {col.name for col in metadata[left].columns}
+            for right in names[i + 1:]:
+                right_cols = {col.name for col in metadata[right].columns}
+                for col in sorted(left_cols & right_cols):
+                    if col.endswith("_id"):
+                        keys.add((left, col, right, col))
+                for left_col in PO_ID_COLUMNS:
+                    for right_col in PO_ID_COLUMNS:
+                        if left_col != right_col and left_col in left_cols and right_col in right_cols:
+                            keys.add((left, left_col, right, right_col))
+        return sorted(keys)
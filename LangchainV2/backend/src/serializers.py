@@ -0,0 +1,104 @@
+# serializers.py
+from decimal import Decimal
+import json
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.nlp2sql.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+RECORDS = "records"
+COLUMNAR = "columnar"
+ARROW = "arrow"
+
+def negotiate_format(accept=None, requested=None):
+    # An explicit ?format= wins, then the Accept header; records is the default
+    if requested in (RECORDS, COLUMNAR, ARROW):
+        return requested
+    accept = accept or ""
+    if ARROW_MEDIA_TYPE in accept:
+        return ARROW
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return COLUMNAR
+    return RECORDS
+
+def json_default(value):
+    if value is pd.NaT:
+        return None
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, pd.Timestamp):
+        return None if pd.isna(value) else value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def dumps(payload):
+    # NaN/inf floats become null, datetimes and numpy values are native
+    return orjson.dumps(payload, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def normalize_frame(df):
+    # Same value rules for every format: Decimal columns become float and
+    # NaN/NaT are treated as nulls (orjson and Arrow both map them to null).
+    df = df.copy(deep=False)
+    for col in df.select_dtypes(include=["object"]).columns:
+        sample = df[col].dropna()
+        if not sample.empty and isinstance(sample.iloc[0], Decimal):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+def iso_strings(values):
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        suffix = "+00:00"
+    else:
+        suffix = ""
+    unit = "us" if (values.dt.microsecond.fillna(0) != 0).any() else "s"
+    strings = np.char.add(np.datetime_as_string(values.to_numpy(), unit=unit), suffix).astype(object)
+    strings[values.isna().to_numpy()] = None
+    return strings.tolist()
+
+def column_lists(df):
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            columns.append(iso_strings(values))
+        else:
+            columns.append(values.tolist())
+    return columns
+
+def to_records(df):
+    if df is None or df.empty:
+        return []
+    df = normalize_frame(df)
+    names = [str(col) for col in df.columns]
+    return [dict(zip(names, row)) for row in zip(*column_lists(df))]
+
+def to_columnar(df):
+    if df is None or df.empty:
+        return {"columns": [] if df is None else [str(col) for col in df.columns], "rows": []}
+    df = normalize_frame(df)
+    return {
+        "columns": [str(col) for col in df.columns],
+        "rows": [list(row) for row in zip(*column_lists(df))]
+    }
+
+def serialize_data(df, data_format):
+    return to_columnar(df) if data_format == COLUMNAR else to_records(df)
+
+def to_arrow_stream(df, metadata=None):
+    # The other response fields travel as JSON in the schema metadata
+    table = pa.Table.from_pandas(normalize_frame(df if df is not None else pd.DataFrame()), preserve_index=False)
+    if metadata is not None:
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"nlp2sql": json.dumps(metadata, default=str).encode("utf-8")
+        })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,140 @@
+# session_store.py
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # sqlite (shared by workers) or memory
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "nlp2sql_sessions.db"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))  # seconds, same as the cookie max_age
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))  # memory backend only
+SESSION_CONTEXT_ENTRIES = int(os.getenv("SESSION_CONTEXT_ENTRIES", "4"))
+
+# Conversation context kept on the server; the session cookie only carries
+# the session id. Each session holds its last few compact context entries.
+class MemorySessionStore:
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl=SESSION_TTL, keep=SESSION_CONTEXT_ENTRIES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.keep = keep
+        self._sessions = OrderedDict()  # session_id -> (entries, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            stored = self._sessions.get(session_id)
+            if stored is None:
+                return []
+            if stored[1] <= time.time():
+                del self._sessions[session_id]
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(stored[0])
+
+    def append(self, session_id, entry):
+        with self._lock:
+            stored = self._sessions.pop(session_id, None)
+            entries = stored[0] if stored is not None and stored[1] > time.time() else []
+            self._sessions[session_id] = ((entries + [entry])[-self.keep:], time.time() + self.ttl)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+# Same interface backed by a SQLite file, so all uvicorn workers see the
+# same conversation whichever one serves the request.
+class SQLiteSessionStore:
+    def __init__(self, path=SESSION_STORE_PATH, ttl=SESSION_TTL, keep=SESSION_CONTEXT_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.keep = keep
+        self.__init_store()
+
+    def get(self, session_id):
+        try:
+            with self.__connect() as conn:
+                row = conn.execute(
+                    "SELECT context FROM sessions WHERE session_id = ? AND expires_at > ?",
+                    (session_id, time.time())
+                ).fetchone()
+        except sqlite3.Error as error:
+            logging.warning("Session read failed: %s", error)
+            return []
+        return json.loads(row[0]) if row else []
+
+    def append(self, session_id, entry):
+        now = time.time()
+        try:
+            with self.__connect() as conn:
+                # BEGIN IMMEDIATE so two workers appending to one session do not lose an entry
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT context FROM sessions WHERE session_id = ? AND expires_at > ?",
+                    (session_id, now)
+                ).fetchone()
+                entries = (json.loads(row[0]) if row else []) + [entry]
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                    (session_id, json.dumps(entries[-self.keep:], separators=(",", ":")), now + self.ttl)
+                )
+        except sqlite3.Error as error:
+            logging.warning("Session write failed: %s", error)
+
+    def clear(self, session_id):
+        try:
+            with self.__connect() as conn:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        except sqlite3.Error as error:
+            logging.warning("Session clear failed: %s", error)
+
+    def cleanup(self):
+        with self.__connect() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    @contextmanager
+    def __connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def __init_store(self):
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    context TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)")
+
+def create_session_store(backend=SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
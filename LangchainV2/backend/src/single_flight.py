@@ -0,0 +1,89 @@
+# single_flight.py
+import asyncio
+import hashlib
+import os
+import threading
+from src.metrics import COALESCED_REQUESTS
+from src.sql_cache import normalize_question
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_MAX_WAITERS = int(os.getenv("COALESCE_MAX_WAITERS", "100"))  # per in-flight question
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "120"))  # seconds a waiter waits for the shared result
+
+def flight_key(*parts):
+    return hashlib.sha256("\n".join(normalize_question(part or "") for part in parts).encode("utf-8")).hexdigest()
+
+class _Flight:
+    def __init__(self, result):
+        self.result = result  # asyncio.Future or threading.Event, depending on the caller
+        self.waiters = 0
+        self.value = None
+
+# Concurrent calls with the same key share one execution: the first caller
+# runs it and the others wait for its result. Over max_waiters a caller runs
+# on its own; a waiter that times out gets an error result.
+class SingleFlight:
+    def __init__(self, max_waiters=COALESCE_MAX_WAITERS, timeout=COALESCE_TIMEOUT):
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(threading.Event())
+                leader = True
+            elif flight.waiters >= self.max_waiters:
+                flight, leader = None, False
+            else:
+                flight.waiters += 1
+                leader = False
+
+        if flight is None:
+            COALESCED_REQUESTS.inc(outcome="overflow")
+            return fn()
+        if not leader:
+            if not flight.result.wait(self.timeout):
+                COALESCED_REQUESTS.inc(outcome="timeout")
+                return self.__timeout_error()
+            COALESCED_REQUESTS.inc(outcome="coalesced")
+            return dict(flight.value)
+
+        COALESCED_REQUESTS.inc(outcome="leader")
+        try:
+            flight.value = fn()
+        except Exception as error:
+            flight.value = {"error": str(error)}
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.result.set()
+        return dict(flight.value)
+
+    async def arun(self, key, coroutine_fn):
+        # The shared execution runs as its own task, so a cancelled caller
+        # (e.g. a client that disconnects) does not cancel it for the others.
+        flight = self._async_flights.get(key)
+        if flight is not None and flight.waiters >= self.max_waiters:
+            COALESCED_REQUESTS.inc(outcome="overflow")
+            return await coroutine_fn()
+        if flight is None:
+            COALESCED_REQUESTS.inc(outcome="leader")
+            flight = self._async_flights[key] = _Flight(asyncio.ensure_future(coroutine_fn()))
+            flight.result.add_done_callback(lambda _: self._async_flights.pop(key, None))
+            return dict(await asyncio.shield(flight.result))
+
+        flight.waiters += 1
+        try:
+            value = await asyncio.wait_for(asyncio.shield(flight.result), self.timeout)
+        except asyncio.TimeoutError:
+            COALESCED_REQUESTS.inc(outcome="timeout")
+            return self.__timeout_error()
+        COALESCED_REQUESTS.inc(outcome="coalesced")
+        return dict(value)
+
+    def __timeout_error(self):
+        return {"error": f"Timed out after {self.timeout:g}s waiting for an identical question already in progress"}
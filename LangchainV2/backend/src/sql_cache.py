@@ -0,0 +1,203 @@
+# sql_cache.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000"))
+SQL_CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", "3600"))  # seconds
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH")  # Optional SQLite file shared by all workers
+
+def normalize_question(text):
+    # Whitespace and trailing punctuation only: case is kept, since literals
+    # such as vendor codes can differ only in case
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text.rstrip("?.!; ")
+
+def schema_fingerprint(db):
+    # Hash of the reflected table/column layout; any DDL change on the
+    # included tables produces a new fingerprint.
+    usable = set(db.get_usable_table_names())
+    parts = []
+    for table in db._metadata.sorted_tables:
+        if table.name not in usable:
+            continue
+        columns = ",".join(f"{col.name}:{type(col.type).__name__}:{col.nullable}" for col in table.columns)
+        parts.append(f"{table.schema}.{table.name}({columns})")
+    return hashlib.sha256("\n".join(sorted(parts)).encode("utf-8")).hexdigest()
+
+def make_cache_key(prompt, fingerprint):
+    # `prompt` is the text sent to the SQL chain, i.e. the question plus any
+    # follow-up context that was injected for it.
+    return hashlib.sha256(f"{fingerprint}\n{normalize_question(prompt)}".encode("utf-8")).hexdigest()
+
+# LRU + TTL cache of generated SQL, optionally persisted to a SQLite file
+class SQLTranslationCache:
+    def __init__(self, max_entries=SQL_CACHE_MAX_ENTRIES, max_bytes=SQL_CACHE_MAX_BYTES,
+                 ttl=SQL_CACHE_TTL, path=SQL_CACHE_PATH):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.fingerprint = None
+        self._entries = OrderedDict()  # key -> (sql, fingerprint, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if self.path:
+            self.__init_store()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self.__drop(key)
+
+        stored = self.__load(key, now) if self.path else None
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__remember(key, *stored)
+            return stored[0]
+
+    def set(self, key, query_sql, fingerprint):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self.__remember(key, query_sql, fingerprint, expires_at)
+        if self.path:
+            self.__store(key, query_sql, fingerprint, expires_at)
+
+    def set_fingerprint(self, fingerprint):
+        # Called after every schema reflection; drops SQL generated against a
+        # different schema both locally and in the shared store.
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            self.fingerprint = fingerprint
+            stale = [key for key, entry in self._entries.items() if entry[1] != fingerprint]
+            for key in stale:
+                self.__drop(key)
+            self.invalidations += len(stale)
+        if self.path:
+            with self.__connect() as conn:
+                removed = conn.execute("DELETE FROM sql_cache WHERE fingerprint != ?", (fingerprint,)).rowcount
+            with self._lock:
+                self.invalidations += removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.path:
+            with self.__connect() as conn:
+                conn.execute("DELETE FROM sql_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "persistent": bool(self.path),
+            }
+
+    def __remember(self, key, query_sql, fingerprint, expires_at):
+        size = len(key) + len(query_sql.encode("utf-8"))
+        if key in self._entries:
+            self.__drop(key)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        self._entries[key] = (query_sql, fingerprint, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self.__drop(oldest)
+            self.evictions += 1
+
+    def __drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    @contextmanager
+    def __connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __init_store(self):
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    key TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_accessed ON sql_cache (accessed_at)")
+
+    def __load(self, key, now):
+        try:
+            with self.__connect() as conn:
+                row = conn.execute(
+                    "SELECT sql, fingerprint, expires_at FROM sql_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE sql_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row
+        except sqlite3.Error as error:
+            logging.warning("SQL cache read failed: %s", error)
+            return None
+
+    def __store(self, key, query_sql, fingerprint, expires_at):
+        now = time.time()
+        size = len(key) + len(query_sql.encode("utf-8"))
+        try:
+            with self.__connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, query_sql, fingerprint, size, expires_at, now)
+                )
+                conn.execute("DELETE FROM sql_cache WHERE expires_at <= ?", (now,))
+                # Enforce the entry and byte caps on the shared store, newest first.
+                kept, total = 0, 0
+                stale = []
+                for row_key, row_size in conn.execute("SELECT key, size FROM sql_cache ORDER BY accessed_at DESC"):
+                    kept += 1
+                    total += row_size
+                    if kept > self.max_entries or total > self.max_bytes:
+                        stale.append((row_key,))
+                if stale:
+                    conn.executemany("DELETE FROM sql_cache WHERE key = ?", stale)
+        except sqlite3.Error as error:
+            logging.warning("SQL cache write failed: %s", error)
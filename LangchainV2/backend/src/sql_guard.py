@@ -0,0 +1,214 @@
+# sql_guard.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import sqlalchemy as sql
+import sqlglot
+from sqlglot import exp
+from src.metrics import timed, SQL_GUARD_CHECKS
+from src.result_fetch import bounded_sql, strip_statement, RESULT_MAX_ROWS
+
+SQL_GUARD_ENABLED = os.getenv("SQL_GUARD_ENABLED", "true").lower() == "true"
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "5000000"))  # Postgres planner cost units
+SQL_GUARD_MAX_ROWS = float(os.getenv("SQL_GUARD_MAX_ROWS", "10000000"))  # planner row estimate
+SQL_GUARD_ACTION = os.getenv("SQL_GUARD_ACTION", "limit")  # limit or reject
+SQL_GUARD_CACHE_SIZE = int(os.getenv("SQL_GUARD_CACHE_SIZE", "1000"))
+SQL_GUARD_PLAN_TTL = int(os.getenv("SQL_GUARD_PLAN_TTL", "600"))  # seconds; planner estimates drift with the data
+
+# Statements that must not appear anywhere in the tree, even inside a CTE
+FORBIDDEN_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create, exp.Alter, exp.Command, exp.TruncateTable, exp.Into)
+
+SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite"}
+# PROMPT has the model qualify every table with the upeg schema
+DEFAULT_SCHEMA = "upeg"
+
+# <> is left out: it matches nearly every pair of rows
+JOIN_COMPARISONS = (exp.EQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)
+
+def conjuncts(condition):
+    if condition is None:
+        return []
+    if isinstance(condition, exp.Where):
+        condition = condition.this
+    condition = condition.unnest()
+    if isinstance(condition, exp.And):
+        return [part for child in (condition.this, condition.expression) for part in conjuncts(child)]
+    return [condition]
+
+def has_join_predicate(conditions, alias):
+    # True when a top-level AND term of the conditions compares a column of
+    # alias with another table's. ON 1 = 1, ON true, a filter against a
+    # literal or a comparison under OR does not count.
+    alias = alias.lower()
+    for condition in conditions:
+        for comparison in conjuncts(condition):
+            if not isinstance(comparison, JOIN_COMPARISONS):
+                continue
+            columns = list(comparison.find_all(exp.Column))
+            if len(columns) < 2:
+                continue
+            tables = {column.table.lower() for column in columns}
+            if alias in tables and len(tables) >= 2:
+                return True
+            if "" in tables:
+                return True  # Unqualified columns: cannot tell which side they belong to
+    return False
+
+def validate_tree(tree, allowed_tables, schema=None):
+    if not isinstance(tree, exp.Query):
+        raise ValueError("Only a single SELECT query is allowed")
+    forbidden = tree.find(*FORBIDDEN_NODES)
+    if forbidden is not None:
+        raise ValueError(f"Query contains a disallowed statement: {forbidden.key.upper()}")
+
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    for table in tree.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier) or table.name.lower() in ctes:
+            continue  # Table functions and CTE references
+        if table.name.lower() not in allowed_tables:
+            raise ValueError(f"Query references a table that is not allowed: {table.sql()}")
+        if table.db and (schema is None or table.db.lower() != schema.lower()):
+            raise ValueError(f"Query references a schema that is not allowed: {table.db}")
+
+    for select in tree.find_all(exp.Select):
+        for join in select.args.get("joins") or []:
+            if join.args.get("using"):
+                continue
+            if not isinstance(join.this, (exp.Table, exp.Subquery)):
+                continue  # LATERAL / UNNEST
+            if not has_join_predicate([join.args.get("on"), select.args.get("where")], join.this.alias_or_name):
+                raise ValueError(f"Query has a cross join without a join predicate on {join.this.alias_or_name}")
+
+# Pre-execution checks on generated SQL: an AST check (single SELECT, allowed
+# tables only, no cross joins without predicates) and, on Postgres, the
+# planner's estimates from EXPLAIN. Parse results and plans are cached per SQL
+# string (for template SQL, the plan of the first parameter values seen); one
+# guard lives per schema snapshot, so a refresh starts clean.
+class SQLGuard:
+    def __init__(self, tables, schema=DEFAULT_SCHEMA, max_cost=SQL_GUARD_MAX_COST, max_rows=SQL_GUARD_MAX_ROWS,
+                 action=SQL_GUARD_ACTION, cache_size=SQL_GUARD_CACHE_SIZE, plan_ttl=SQL_GUARD_PLAN_TTL):
+        self.allowed_tables = {table.lower() for table in tables}
+        self.schema = schema or DEFAULT_SCHEMA
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.cache_size = cache_size
+        self.plan_ttl = plan_ttl
+        self._validated = OrderedDict()  # (dialect, sql) -> error message or None
+        self._plans = OrderedDict()  # sql -> (cost, rows, expires_at)
+        self._lock = threading.Lock()
+
+    def validate(self, query_sql, dialect):
+        key = (dialect, query_sql)
+        with self._lock:
+            if key in self._validated:
+                self._validated.move_to_end(key)
+                error = self._validated[key]
+                if error:
+                    raise ValueError(error)
+                return
+        error = None
+        with timed("sql_validation"):
+            try:
+                trees = [tree for tree in sqlglot.parse(query_sql, read=SQLGLOT_DIALECTS.get(dialect)) if tree is not None]
+                if len(trees) != 1:
+                    raise ValueError("Only a single SELECT query is allowed")
+                validate_tree(trees[0], self.allowed_tables, self.schema)
+            except sqlglot.errors.ParseError as parse_error:
+                error = f"Could not parse the generated SQL: {str(parse_error).splitlines()[0]}"
+            except ValueError as validation_error:
+                error = str(validation_error)
+        with self._lock:
+            self.__remember(self._validated, key, error)
+        if error:
+            SQL_GUARD_CHECKS.inc(outcome="invalid")
+            raise ValueError(error)
+
+    def check(self, conn, query_sql, max_rows=RESULT_MAX_ROWS, params=None):
+        self.validate(query_sql, conn.dialect.name)
+        if conn.dialect.name != "postgresql":
+            SQL_GUARD_CHECKS.inc(outcome="unplanned")
+            return "unplanned"  # No planner costs to compare against (e.g. SQLite)
+        plan = self.__cached_plan(query_sql)
+        if plan is None:
+            with timed("sql_explain"):
+                plan = self.__plan(conn.execute(sql.text(self.__explain(query_sql)), params or {}).scalar())
+            self.__store_plan(query_sql, plan)
+        bounded_plan = None
+        if self.__over(plan) and self.action == "limit":
+            bounded = bounded_sql(query_sql, max_rows)
+            bounded_plan = self.__cached_plan(bounded)
+            if bounded_plan is None:
+                with timed("sql_explain"):
+                    bounded_plan = self.__plan(conn.execute(sql.text(self.__explain(bounded)), params or {}).scalar())
+                self.__store_plan(bounded, bounded_plan)
+        return self.__verdict(plan, bounded_plan)
+
+    async def acheck(self, conn, query_sql, max_rows=RESULT_MAX_ROWS, params=None):
+        self.validate(query_sql, conn.dialect.name)
+        if conn.dialect.name != "postgresql":
+            SQL_GUARD_CHECKS.inc(outcome="unplanned")
+            return "unplanned"
+        plan = self.__cached_plan(query_sql)
+        if plan is None:
+            with timed("sql_explain"):
+                plan = self.__plan((await conn.execute(sql.text(self.__explain(query_sql)), params or {})).scalar())
+            self.__store_plan(query_sql, plan)
+        bounded_plan = None
+        if self.__over(plan) and self.action == "limit":
+            bounded = bounded_sql(query_sql, max_rows)
+            bounded_plan = self.__cached_plan(bounded)
+            if bounded_plan is None:
+                with timed("sql_explain"):
+                    bounded_plan = self.__plan((await conn.execute(sql.text(self.__explain(bounded)), params or {})).scalar())
+                self.__store_plan(bounded, bounded_plan)
+        return self.__verdict(plan, bounded_plan)
+
+    def __explain(self, query_sql):
+        # Plan only: EXPLAIN without ANALYZE never runs the query
+        return f"EXPLAIN (FORMAT JSON) {strip_statement(query_sql)}"
+
+    def __plan(self, explained):
+        plan = (json.loads(explained) if isinstance(explained, str) else explained)[0]["Plan"]
+        return plan["Total Cost"], plan["Plan Rows"]
+
+    def __over(self, plan):
+        return plan[0] > self.max_cost or plan[1] > self.max_rows
+
+    def __verdict(self, plan, bounded_plan):
+        # Results are always fetched through the LIMIT wrapper; with the
+        # "limit" action a query that is too big on its own still runs when
+        # the limited plan fits within the cost threshold.
+        if not self.__over(plan):
+            SQL_GUARD_CHECKS.inc(outcome="ok")
+            return "ok"
+        if bounded_plan is not None and bounded_plan[0] <= self.max_cost:
+            SQL_GUARD_CHECKS.inc(outcome="limited")
+            logging.info("Generated SQL limited: estimated cost %.0f, rows %.0f", *plan)
+            return "limited"
+        SQL_GUARD_CHECKS.inc(outcome="rejected")
+        raise ValueError(
+            f"Query rejected: estimated cost {plan[0]:.0f} and {plan[1]:.0f} rows exceed the limits "
+            f"({self.max_cost:.0f} cost, {self.max_rows:.0f} rows)"
+        )
+
+    def __cached_plan(self, query_sql):
+        with self._lock:
+            plan = self._plans.get(query_sql)
+            if plan is None or plan[2] <= time.time():
+                return None
+            self._plans.move_to_end(query_sql)
+            return plan[:2]
+
+    def __store_plan(self, query_sql, plan):
+        with self._lock:
+            self.__remember(self._plans, query_sql, (*plan, time.time() + self.plan_ttl))
+
+    def __remember(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.cache_size:
+            entries.popitem(last=False)
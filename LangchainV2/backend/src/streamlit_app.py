@@ -1,31 +1,31 @@
 import streamlit as st
 from utilities.config import *
-from generative_ai import SQLNaturaLanguage
 import pandas as pd
-import sqlalchemy as sql
 import time
 import os
+import sys
 from dotenv import load_dotenv
 
+# The agent's modules import each other as src.*; make the backend directory
+# importable when Streamlit runs this file directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.generative_ai import SQLNaturaLanguage
+
 load_dotenv()
 
+RENDER_INTERVAL = 0.1  # seconds between redraws of a streaming summary
+
+@st.cache_resource
+def get_agent(temperature=0, model="gemini-2.5-flash"):
+    # One agent per (temperature, model) for the whole Streamlit server: the
+    # engine pool, reflected schema and LLM clients are shared by all sessions
+    return SQLNaturaLanguage(temperature=temperature, model=model)
+
 class App_queries_naturallanguage():
     def __init__(self, temperature=0, model="gemini-2.5-flash"):
-        db_url = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-        self.sql_engine = sql.create_engine(db_url)
-        self.conn = self.sql_engine.connect()
-        self.API_KEY = os.getenv("GOOGLE_API_KEY")
         self.temperature = temperature
         self.model = model
-
-    def _call_llm_sql(self, question=None, number_rows=200):
-        sql_model = SQLNaturaLanguage(
-            temperature=self.temperature,
-            model=self.model
-        )
-        prompt = PROMPT.format(question=question, number_rows=number_rows)
-        context = "\n\n".join(st.session_state.get("context_summaries", []))
-        return sql_model.execution(prompt=prompt, context_summary=context)
+        self.agent = get_agent(temperature=temperature, model=model)
 
     def execute(self):
         st.set_page_config(layout="wide", page_icon="🤖")
@@ -59,9 +59,13 @@ class App_queries_naturallanguage():
 
         user_input = st.text_input("Ask your procurement question:", value="Top 5 most expensive orders", key="user_query", label_visibility="visible")
 
+        streamed = None
         if st.button("ASK", use_container_width=True):
-            output = self._call_llm_sql(question=user_input, number_rows=number_rows)
+            # The new answer is drawn as it streams in, on top of the earlier ones
             st.session_state.past.append(user_input)
+            streamed = len(st.session_state.past) - 1
+            self.__queryseparator(streamed)
+            output = self.__stream_answer(question=user_input, number_rows=number_rows)
             st.session_state.generated.append(output)
 
             if "context_summary" in output:
@@ -71,13 +75,14 @@ class App_queries_naturallanguage():
         # Show all past questions and responses (latest first)
         if st.session_state["generated"]:
             for i in reversed(range(len(st.session_state["generated"]))):
+                if i == streamed:
+                    continue
                 self.__queryseparator(i)
                 chat_message = st.session_state["generated"][i]
                 if "error" in chat_message:
                     self.__error_show(chat_message)
                 else:
-                    # Animate only the most recent message (now on top)
-                    self.__show_result(chat_message, animate=(i == len(st.session_state["generated"]) - 1))
+                    self.__show_result(chat_message)
 
     def __queryseparator(self, i):
         st.markdown(f"<hr/><h5>🧾 Query {i+1}</h5><p><b>User:</b> {st.session_state['past'][i]}</p>", unsafe_allow_html=True)
@@ -86,12 +91,9 @@ class App_queries_naturallanguage():
         st.markdown("**Error occurred:**")
         st.code(chat_message["error"], language="python")
 
-    def __show_result(self, chat_message, animate=False):
+    def __show_result(self, chat_message):
         if "result" in chat_message:
-            if animate:
-                self.__typing_text(chat_message["result"])
-            else:
-                st.markdown(f"<strong>{chat_message['result']}</strong>", unsafe_allow_html=True)
+            st.markdown(f"<strong>{chat_message['result']}</strong>", unsafe_allow_html=True)
 
         if "query_df" in chat_message:
             st.dataframe(chat_message["query_df"])
@@ -99,13 +101,39 @@ class App_queries_naturallanguage():
         # if "query_sql" in chat_message:
         #     st.code(chat_message["query_sql"], language="sql")
 
-    def __typing_text(self, text, delay=0.02):
+    def __stream_answer(self, question, number_rows=200):
+        # Summary tokens come straight from the summary model's stream; the
+        # placeholder is redrawn at most every RENDER_INTERVAL, not per token
+        prompt = PROMPT.format(question=question, number_rows=number_rows)
+        context = "\n\n".join(st.session_state.get("context_summaries", []))
         placeholder = st.empty()
-        displayed = ""
-        for char in text:
-            displayed += char
-            placeholder.markdown(f"<strong>{displayed}</strong>", unsafe_allow_html=True)
-            time.sleep(delay)
+        output, frames, tokens = {}, [], []
+        rendered_at = 0.0
+        for event, payload in self.agent.execution_stream(prompt=prompt, context_summary=context, include_context=True):
+            if event == "sql":
+                output["query_sql"] = payload["query_sql"]
+            elif event == "rows":
+                frames.append(payload)
+            elif event == "summary":
+                tokens.append(payload)
+                if time.perf_counter() - rendered_at >= RENDER_INTERVAL:
+                    placeholder.markdown(f"<strong>{''.join(tokens)}</strong>", unsafe_allow_html=True)
+                    rendered_at = time.perf_counter()
+            elif event == "context":
+                output["context_summary"] = payload
+            elif event == "error":
+                output["error"] = payload["error"]
+
+        if "error" in output:
+            placeholder.empty()
+            self.__error_show(output)
+            return output
+        if tokens:
+            output["result"] = "".join(tokens)
+            placeholder.markdown(f"<strong>{output['result']}</strong>", unsafe_allow_html=True)
+        output["query_df"] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        st.dataframe(output["query_df"])
+        return output
 
     def __init_session(self):
         if "generated" not in st.session_state:
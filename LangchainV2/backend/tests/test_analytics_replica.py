@@ -0,0 +1,65 @@
+import pytest
+import sqlalchemy as sql
+from src.result_fetch import BoundedFetch
+
+pytest.importorskip("duckdb")
+from src.analytics_replica import AnalyticsReplica  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sql.create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    with engine.begin() as conn:
+        conn.execute(sql.text("CREATE TABLE orders (id INTEGER, note TEXT, amount REAL, updated INTEGER)"))
+        conn.execute(sql.text("INSERT INTO orders VALUES (:id, :note, :amount, :id)"), [
+            {"id": i, "note": None if i < 5 else f"note {i}", "amount": None if i < 5 else 1.5} for i in range(10)
+        ])
+    return engine
+
+
+def replica(tmp_path, **options):
+    return AnalyticsReplica(["orders"], path=str(tmp_path / "replica"), fetch_batch=3, **options)
+
+
+def test_columns_null_in_the_first_chunk_are_replicated(tmp_path, engine):
+    target = replica(tmp_path)
+    assert target.refresh(engine) == []
+    fetch = BoundedFetch("SELECT COUNT(note) AS notes, SUM(amount) AS total FROM orders")
+    table = target.execute(fetch, "sqlite")
+    assert table.to_pylist() == [{"notes": 5, "total": 7.5}]
+
+
+def test_only_aggregates_are_routed(tmp_path, engine):
+    target = replica(tmp_path)
+    target.refresh(engine)
+    assert target.route("SELECT id FROM orders", "sqlite") is None
+    assert target.route("SELECT COUNT(*) FROM orders", "sqlite") == 'SELECT COUNT(*) AS "COUNT(*)" FROM orders'
+
+
+def test_recent_tables_are_not_copied_again(tmp_path, engine):
+    first = replica(tmp_path, refresh_interval=300)
+    first.refresh(engine)
+    refreshed_at = first.status()["orders"]["age_seconds"]
+    with engine.begin() as conn:
+        conn.execute(sql.text("INSERT INTO orders VALUES (10, 'late', 1.0, 10)"))
+
+    second = replica(tmp_path, refresh_interval=300)  # Another worker, same directory
+    assert second.refresh(engine) == []
+    assert second.status()["orders"]["rows"] == 10 and second.status()["orders"]["age_seconds"] >= refreshed_at
+    assert second.refresh(engine, force=True) == []
+    assert second.status()["orders"]["rows"] == 11
+
+
+def test_incremental_refresh_keeps_the_newest_row(tmp_path, engine):
+    target = replica(tmp_path, incremental="orders:updated:id", refresh_interval=0)
+    target.refresh(engine)
+    with engine.begin() as conn:
+        conn.execute(sql.text("UPDATE orders SET amount = 100, updated = 20 WHERE id = 9"))
+    target.refresh(engine)
+    table = target.execute(BoundedFetch("SELECT COUNT(*) AS n, MAX(amount) AS top FROM orders"), "sqlite")
+    assert table.to_pylist() == [{"n": 10, "top": 100.0}]
+
+
+def test_failed_tables_are_reported(tmp_path, engine):
+    target = AnalyticsReplica(["orders", "missing"], path=str(tmp_path / "replica"))
+    assert target.refresh(engine) == ["missing"]
@@ -0,0 +1,21 @@
+import pandas as pd
+from src.fast_summary import render_fast_summary, use_fast_summary
+
+
+def test_rows_of_one_order_stay_apart():
+    df = pd.DataFrame({"po_id": [1, 1, 2], "item_code": ["A", "B", "C"], "quantity": [2.0, 3.0, 1.0]})
+    summary = render_fast_summary(df)
+    assert "**For Purchase Order ID: 1**\n* Item Code: A; Quantity: 2.00\n* Item Code: B; Quantity: 3.00" in summary
+    assert "**For Purchase Order ID: 2**\n* Item Code: C\n* Quantity: 1.00" in summary
+
+
+def test_float_ids_print_as_integers():
+    df = pd.DataFrame({"vendor_id": [7.0, None], "name": ["a", "b"]})
+    summary = render_fast_summary(df)
+    assert "* Vendor ID: 7\n" in summary and "* Vendor ID: N/A" in summary
+
+
+def test_truncated_results_go_to_the_llm():
+    df = pd.DataFrame({"id": [1]})
+    assert use_fast_summary(df, "list orders")
+    assert not use_fast_summary(df, "list orders", truncated=True)
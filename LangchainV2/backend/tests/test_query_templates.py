@@ -0,0 +1,98 @@
+import datetime
+import pytest
+from src.query_templates import QueryTemplate, QueryTemplateStore, derive_template
+
+
+def test_template_matches_and_binds_slots():
+    template = QueryTemplate(
+        "top {limit:number} purchase orders after {after:date} for vendor {vendor:quoted}",
+        "SELECT * FROM upeg.purchase_order_main WHERE vendor_name = :vendor AND po_date > :after LIMIT :limit",
+    )
+    question = "Top 5  purchase orders after 2024-03-01 for vendor 'ABC Ltd'?"
+    params = template.match(question.rstrip("?"), {"top", "purchase", "orders", "after", "for", "vendor"})
+    assert params == {"limit": 5, "after": datetime.date(2024, 3, 1), "vendor": "ABC Ltd"}
+    assert template.match("top five purchase orders after 2024-03-01 for vendor 'ABC'", {"top", "purchase", "orders", "after", "for", "vendor"}) is None
+
+
+def test_date_slot_bound_in_the_sql_format():
+    template = QueryTemplate("orders after {after:date}", "SELECT 1 WHERE po_date > :after", formats={"after": "%d-%m-%Y"})
+    assert template.match("orders after 1 March 2024", {"orders", "after"}) == {"after": "01-03-2024"}
+
+
+@pytest.mark.parametrize("pattern, query_sql", [
+    ("orders over {amount:number}", "SELECT 1 WHERE amount > :limit"),
+    ("orders over {amount:number} and {amount:number}", "SELECT 1 WHERE amount > :amount"),
+])
+def test_slots_must_match_sql_parameters(pattern, query_sql):
+    with pytest.raises(ValueError):
+        QueryTemplate(pattern, query_sql)
+
+
+def test_derive_template():
+    pattern, template_sql, formats, values = derive_template(
+        "orders above 5000 placed after 2024-01-15",
+        "SELECT po_id FROM upeg.purchase_order_main WHERE total_amount > 5000 AND TO_DATE(po_date, 'DD-MM-YYYY') > '15-01-2024'",
+        "postgresql",
+    )
+    assert pattern == "orders above {number_1:number} placed after {date_1:date}"
+    assert template_sql == "SELECT po_id FROM upeg.purchase_order_main WHERE total_amount > :number_1 AND TO_DATE(po_date, 'DD-MM-YYYY') > :date_1"
+    assert formats == {"date_1": "%d-%m-%Y"}
+    assert values == {"number_1": 5000, "date_1": "2024-01-15"}
+
+
+@pytest.mark.parametrize("question, query_sql", [
+    # Same value as two unrelated literals: one slot would tie them together
+    ("top 10 orders", "SELECT * FROM upeg.purchase_order_main WHERE total_amount > 10 ORDER BY total_amount DESC LIMIT 10"),
+    # Question value the SQL does not use
+    ("top 10 orders", "SELECT * FROM upeg.purchase_order_main LIMIT 5"),
+    # Two slots with the same value
+    ("orders between 10 and 10", "SELECT * FROM upeg.purchase_order_main WHERE amount BETWEEN 10 AND 10"),
+    # No literal values at all
+    ("all open orders", "SELECT * FROM upeg.purchase_order_main WHERE status = 'Open'"),
+])
+def test_derive_template_refuses_ambiguous_shapes(question, query_sql):
+    assert derive_template(question, query_sql, "postgresql") is None
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QueryTemplateStore(path=str(tmp_path / "templates.db"), promote_after=3, reload_interval=0)
+
+
+def top_orders(limit):
+    return f"SELECT po_id FROM upeg.purchase_order_main ORDER BY total_amount DESC LIMIT {limit}"
+
+
+def test_promotion_after_distinct_successes(store):
+    store.set_fingerprint("fp")
+    assert store.observe("top 5 orders", top_orders(5), "postgresql", "fp") is None
+    assert store.observe("top 5 orders", top_orders(5), "postgresql", "fp") is None  # Same values count once
+    assert store.observe("top 7 orders", top_orders(7), "postgresql", "fp") is None
+    template = store.observe("top 9 orders", top_orders(9), "postgresql", "fp")
+    assert template is not None and template.source == "promoted"
+
+    matched, params = store.match("Top 25 orders?")
+    assert matched.query_sql == top_orders(":number_1")
+    assert params == {"number_1": 25}
+
+
+def test_different_sql_resets_the_candidate(store):
+    store.set_fingerprint("fp")
+    store.observe("top 5 orders", top_orders(5), "postgresql", "fp")
+    store.observe("top 7 orders", top_orders(7), "postgresql", "fp")
+    store.observe("top 8 orders", "SELECT po_id FROM upeg.purchase_order_main LIMIT 8", "postgresql", "fp")
+    assert store.observe("top 9 orders", top_orders(9), "postgresql", "fp") is None
+    assert store.match("top 25 orders") is None
+
+
+def test_schema_change_drops_promoted_templates_only(store):
+    store.set_fingerprint("fp")
+    store.add(QueryTemplate("open orders for {vendor:quoted}", "SELECT 1 WHERE vendor_name = :vendor"))
+    for limit in (5, 7, 9):
+        store.observe(f"top {limit} orders", top_orders(limit), "postgresql", "fp")
+    assert len(store.list_templates()) == 2
+
+    store.set_fingerprint("new")
+    assert [template["source"] for template in store.list_templates()] == ["manual"]
+    assert store.remove("open orders for {vendor:quoted}")
+    assert store.match("open orders for 'ABC'") is None
@@ -0,0 +1,58 @@
+import pytest
+import sqlalchemy as sql
+from src.result_fetch import BoundedFetch, bounded_sql, count_sql, strip_statement
+
+
+@pytest.fixture
+def engine():
+    engine = sql.create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(sql.text("CREATE TABLE orders (id INTEGER, amount REAL)"))
+        conn.execute(sql.text("INSERT INTO orders VALUES (:id, :amount)"), [{"id": i, "amount": i * 1.5} for i in range(10)])
+    return engine
+
+
+@pytest.mark.parametrize("query_sql", [
+    "SELECT id FROM orders",
+    "SELECT id FROM orders;",
+    "SELECT id FROM orders -- newest first",
+    "SELECT id FROM orders; -- newest first",
+    "SELECT id FROM orders;\n/* done */ ;",
+])
+def test_strip_statement_drops_trailing_semicolons_and_comments(query_sql):
+    assert strip_statement(query_sql) == "SELECT id FROM orders"
+
+
+def test_strip_statement_keeps_inner_comments_and_strings():
+    assert strip_statement("SELECT id -- the id\nFROM orders;") == "SELECT id -- the id\nFROM orders"
+    assert strip_statement("SELECT ';--' AS x;") == "SELECT ';--' AS x"
+
+
+@pytest.mark.parametrize("query_sql", ["SELECT id FROM orders; -- all orders", "SELECT id -- ids\nFROM orders -- all"])
+def test_wrappers_run_with_comments(engine, query_sql):
+    with engine.connect() as conn:
+        assert len(conn.execute(sql.text(bounded_sql(query_sql, 3))).fetchall()) == 4
+        assert conn.execute(sql.text(count_sql(query_sql))).scalar() == 10
+
+
+def test_fetch_caps_rows_and_counts_total(engine):
+    fetch = BoundedFetch("SELECT * FROM orders ORDER BY id", max_rows=4, batch_size=3)
+    with engine.connect() as conn:
+        df = fetch.fetch_all(conn)
+    assert df["id"].tolist() == [0, 1, 2, 3]
+    assert fetch.info() == {"sql_guard": None, "backend": "database", "row_count": 4, "truncated": True, "total_count": 10}
+
+
+def test_fetch_under_the_cap(engine):
+    fetch = BoundedFetch("SELECT * FROM orders WHERE id < :limit", max_rows=50, batch_size=3, params={"limit": 5})
+    with engine.connect() as conn:
+        chunks = list(fetch.chunks(conn))
+    assert [len(chunk) for chunk in chunks] == [3, 2]
+    assert not fetch.truncated and fetch.info()["total_count"] == 5
+
+
+def test_empty_result_keeps_columns(engine):
+    fetch = BoundedFetch("SELECT id, amount FROM orders WHERE id < 0")
+    with engine.connect() as conn:
+        df = fetch.fetch_all(conn)
+    assert df.empty and list(df.columns) == ["id", "amount"]
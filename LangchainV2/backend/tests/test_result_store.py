@@ -0,0 +1,44 @@
+import os
+import time
+import pandas as pd
+import pytest
+from src.result_store import ResultStore, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    for offset in (0, 200, 123456):
+        assert decode_cursor(encode_cursor(offset)) == offset
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(-1), "eyJvIjogIjEwIn0"])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_come_from_the_spilled_result(tmp_path):
+    store = ResultStore(directory=str(tmp_path), ttl=60)
+    df = pd.DataFrame({"id": range(25), "vendor": [f"V{i}" for i in range(25)]})
+    query_id = store.save(df)
+
+    page, total = store.page(query_id, 10, 10)
+    assert total == 25
+    assert page["id"].tolist() == list(range(10, 20))
+    page, _ = store.page(query_id, 20, 10)
+    assert page["vendor"].tolist() == ["V20", "V21", "V22", "V23", "V24"]
+
+
+def test_unknown_and_expired_results(tmp_path):
+    store = ResultStore(directory=str(tmp_path), ttl=60)
+    with pytest.raises(KeyError):
+        store.page("../../etc/passwd", 0, 10)
+    with pytest.raises(KeyError):
+        store.page("0" * 32, 0, 10)
+
+    query_id = store.save(pd.DataFrame({"id": [1]}))
+    old = time.time() - 120
+    os.utime(os.path.join(str(tmp_path), f"{query_id}.arrow"), (old, old))
+    with pytest.raises(KeyError):
+        store.page(query_id, 0, 10)
+    assert store.cleanup() == 1
+    assert os.listdir(str(tmp_path)) == []
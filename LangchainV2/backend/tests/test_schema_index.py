@@ -0,0 +1,57 @@
+import pytest
+import sqlalchemy as sql
+from langchain_community.utilities import SQLDatabase
+from src.schema_index import SchemaIndex, extract_question, tokenize
+
+TABLES = {
+    "purchase_order_main": "po_id INTEGER, vendor_name TEXT, po_date TEXT, total_amount REAL, status TEXT, expected_delivery_date TEXT",
+    "purchase_order_item": "purchase_order_id INTEGER, item_code TEXT, item_description TEXT, quantity REAL, unit_price REAL",
+    "purchase_order_item_header": "po_id INTEGER, line_no INTEGER, uom TEXT",
+    "purchase_order_tolerance": "po_id INTEGER, tolerance_percent REAL",
+    "purchase_order_distribution": "po_id INTEGER, cost_center TEXT, gl_account TEXT",
+    "purchase_order_approval": "po_id INTEGER, approver TEXT, approval_status TEXT, approved_on TEXT",
+    "purchase_order_receipt": "po_id INTEGER, grn_number TEXT, received_quantity REAL, receipt_date TEXT",
+}
+
+
+@pytest.fixture(scope="module")
+def index():
+    engine = sql.create_engine("sqlite://")
+    with engine.begin() as conn:
+        for table, columns in TABLES.items():
+            conn.execute(sql.text(f"CREATE TABLE {table} ({columns})"))
+    return SchemaIndex(SQLDatabase(engine, sample_rows_in_table_info=0))
+
+
+def test_tokenize_stems_plurals():
+    assert tokenize("Purchase_Orders with Tolerances?") == ["purchase", "order", "with", "tolerance"]
+    for plural, singular in [("statuses", "status"), ("addresses", "address"), ("boxes", "box"), ("analysis", "analysis")]:
+        assert tokenize(plural) == tokenize(singular)
+
+
+def test_extract_question():
+    assert extract_question("Long instructions...\nQuestion: top 5 orders") == "top 5 orders"
+
+
+@pytest.mark.parametrize("question", ["top 5 most expensive orders", "which orders may be delayed"])
+def test_general_order_questions_get_the_full_schema(index, question):
+    # "order" is in every table name, so it says nothing about which table to use
+    assert index.select(question) is None
+
+
+def test_specific_question_is_pruned_and_keeps_the_main_table(index):
+    tables = index.select("tolerance percent for each purchase order")
+    assert tables[0] == "purchase_order_tolerance"
+    assert "purchase_order_main" in tables
+    assert len(tables) < len(TABLES)
+
+
+def test_near_tie_falls_back(index):
+    # po_id is on five tables: the three kept are no better than the ones left out
+    assert index.select("po id") is None
+
+
+def test_render_adds_join_keys(index):
+    info = index.render(["purchase_order_main", "purchase_order_item"])
+    assert "CREATE TABLE purchase_order_main" in info
+    assert "purchase_order_item.purchase_order_id = purchase_order_main.po_id" in info
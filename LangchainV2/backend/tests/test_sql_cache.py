@@ -0,0 +1,65 @@
+import time
+from src.sql_cache import SQLTranslationCache, make_cache_key, normalize_question
+from src.single_flight import flight_key
+
+
+def test_normalize_question_keeps_case():
+    assert normalize_question("  orders  for vendor ABC?? ") == "orders for vendor ABC"
+    assert normalize_question("orders for vendor ABC") != normalize_question("orders for vendor abc")
+
+
+def test_cache_and_flight_keys_differ_by_case():
+    assert make_cache_key("orders for vendor ABC", "fp") == make_cache_key("orders  for vendor ABC?", "fp")
+    assert make_cache_key("orders for vendor ABC", "fp") != make_cache_key("orders for vendor abc", "fp")
+    assert make_cache_key("orders", "fp1") != make_cache_key("orders", "fp2")
+    assert flight_key("orders for vendor ABC") != flight_key("orders for vendor abc")
+
+
+def test_get_set_and_expiry():
+    cache = SQLTranslationCache(ttl=60, path=None)
+    assert cache.get("k") is None
+    cache.set("k", "SELECT 1", "fp")
+    assert cache.get("k") == "SELECT 1"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    cache = SQLTranslationCache(ttl=-1, path=None)
+    cache.set("k", "SELECT 1", "fp")
+    assert cache.get("k") is None
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = SQLTranslationCache(max_entries=2, path=None)
+    cache.set("a", "SELECT 1", "fp")
+    cache.set("b", "SELECT 2", "fp")
+    cache.get("a")
+    cache.set("c", "SELECT 3", "fp")
+    assert cache.get("b") is None
+    assert cache.get("a") == "SELECT 1"
+    assert cache.stats()["evictions"] == 1
+
+    cache = SQLTranslationCache(max_bytes=15, path=None)
+    cache.set("a", "SELECT 1", "fp")
+    cache.set("b", "SELECT 2", "fp")
+    assert cache.get("a") is None
+    cache.set("big", "SELECT " + "x" * 100, "fp")
+    assert cache.get("big") is None
+
+
+def test_fingerprint_change_invalidates():
+    cache = SQLTranslationCache(path=None)
+    cache.set_fingerprint("fp1")
+    cache.set("k", "SELECT 1", "fp1")
+    cache.set_fingerprint("fp2")
+    assert cache.get("k") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_persistent_store_is_shared(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = SQLTranslationCache(path=path)
+    writer.set("k", "SELECT 1", "fp")
+    reader = SQLTranslationCache(path=path)
+    assert reader.get("k") == "SELECT 1"
+
+    reader.set_fingerprint("other")
+    assert SQLTranslationCache(path=path).get("k") is None
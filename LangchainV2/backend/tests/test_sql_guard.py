@@ -0,0 +1,105 @@
+import json
+import pytest
+import sqlalchemy as sql
+from src.sql_guard import SQLGuard
+
+TABLES = ["purchase_order_main", "purchase_order_item"]
+
+
+@pytest.fixture
+def guard():
+    return SQLGuard(TABLES, schema=None, max_cost=1000, max_rows=1000)
+
+
+def check(guard, query_sql):
+    guard.validate(query_sql, "postgresql")
+
+
+@pytest.mark.parametrize("query_sql", [
+    "SELECT po_id, total_amount FROM upeg.purchase_order_main ORDER BY total_amount DESC LIMIT 5",
+    "SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.po_id = i.purchase_order_id",
+    "SELECT * FROM upeg.purchase_order_main m LEFT JOIN upeg.purchase_order_item i ON (i.purchase_order_id = m.po_id) AND m.status = 'Open'",
+    "SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.status = 'Open' WHERE m.po_id = i.purchase_order_id",
+    "SELECT * FROM upeg.purchase_order_main m, upeg.purchase_order_item i WHERE m.po_id = i.purchase_order_id AND i.quantity > 2",
+    "SELECT * FROM upeg.purchase_order_main JOIN upeg.purchase_order_item USING (po_id)",
+    "SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON i.created_on BETWEEN m.po_date AND m.expected_delivery_date",
+    "SELECT upeg.purchase_order_main.po_id FROM upeg.purchase_order_main JOIN upeg.purchase_order_item "
+    "ON upeg.purchase_order_main.po_id = upeg.purchase_order_item.purchase_order_id",
+    "WITH recent AS (SELECT * FROM upeg.purchase_order_main) SELECT COUNT(*) FROM recent",
+])
+def test_accepted(guard, query_sql):
+    check(guard, query_sql)
+
+
+@pytest.mark.parametrize("query_sql, message", [
+    ("DELETE FROM upeg.purchase_order_main", "single SELECT"),
+    ("WITH gone AS (DELETE FROM upeg.purchase_order_main RETURNING *) SELECT * FROM gone", "disallowed statement"),
+    ("SELECT * INTO upeg.copy FROM upeg.purchase_order_main", "disallowed statement"),
+    ("SELECT 1; SELECT 2", "single SELECT"),
+    ("SELECT * FROM upeg.vendor_bank_details", "table that is not allowed"),
+    ("SELECT * FROM public.purchase_order_main", "schema that is not allowed"),
+    ("SELECT * FROM upeg.purchase_order_main, upeg.purchase_order_item", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON 1 = 1", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON true", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.status = 'Open'", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.po_id <> i.purchase_order_id", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.po_id = i.purchase_order_id OR 1 = 1", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m, upeg.purchase_order_item i WHERE (m.po_id = i.purchase_order_id OR true)", "cross join"),
+    ("SELECT * FROM upeg.purchase_order_main m JOIN upeg.purchase_order_item i ON m.po_id = m.po_id", "cross join"),
+    ("SELECT FROM WHERE", "parse"),
+])
+def test_rejected(guard, query_sql, message):
+    with pytest.raises(ValueError, match=message):
+        check(guard, query_sql)
+
+
+def test_schema_comes_from_postgres_schema():
+    guard = SQLGuard(TABLES, schema="procurement")
+    guard.validate("SELECT * FROM procurement.purchase_order_main", "postgresql")
+    with pytest.raises(ValueError, match="schema"):
+        guard.validate("SELECT * FROM upeg.purchase_order_main", "postgresql")
+
+
+def test_verdicts_are_cached(guard):
+    with pytest.raises(ValueError):
+        check(guard, "SELECT * FROM upeg.secrets")
+    with pytest.raises(ValueError):
+        check(guard, "SELECT * FROM upeg.secrets")
+
+
+class PlannerConnection:
+    # Answers EXPLAIN with a fixed plan per statement: the bounded (row-capped) form is cheap
+    dialect = type("Dialect", (), {"name": "postgresql"})
+
+    def __init__(self, cost, bounded_cost):
+        self.cost, self.bounded_cost, self.explains = cost, bounded_cost, 0
+
+    def execute(self, statement, params=None):
+        self.explains += 1
+        cost = self.bounded_cost if "bounded_result" in str(statement) else self.cost
+        plan = json.dumps([{"Plan": {"Total Cost": cost, "Plan Rows": cost}}])
+        return type("Result", (), {"scalar": lambda _: plan})()
+
+
+def test_planner_verdicts():
+    query_sql = "SELECT * FROM upeg.purchase_order_main"
+    assert SQLGuard(TABLES, max_cost=1000, max_rows=1000).check(PlannerConnection(10, 10), query_sql) == "ok"
+    assert SQLGuard(TABLES, max_cost=1000, max_rows=1000).check(PlannerConnection(10 ** 6, 10), query_sql) == "limited"
+    with pytest.raises(ValueError, match="exceed the limits"):
+        SQLGuard(TABLES, max_cost=1000, max_rows=1000).check(PlannerConnection(10 ** 6, 10 ** 6), query_sql)
+    with pytest.raises(ValueError, match="exceed the limits"):
+        SQLGuard(TABLES, max_cost=1000, max_rows=1000, action="reject").check(PlannerConnection(10 ** 6, 10), query_sql)
+
+
+def test_plans_are_cached():
+    guard = SQLGuard(TABLES, max_cost=1000, max_rows=1000)
+    conn = PlannerConnection(10, 10)
+    guard.check(conn, "SELECT * FROM upeg.purchase_order_main")
+    guard.check(conn, "SELECT * FROM upeg.purchase_order_main")
+    assert conn.explains == 1
+
+
+def test_sqlite_has_no_planner_check():
+    engine = sql.create_engine("sqlite://")
+    with engine.connect() as conn:
+        assert SQLGuard(TABLES).check(conn, "SELECT * FROM purchase_order_main") == "unplanned"
@@ -3,8 +3,8 @@ import { Box, IconButton, Stack, TextField, Typography } from "@mui/material";
 import { useEffect, useRef, useState } from "react";
 import { useSelector, useDispatch } from "react-redux";
 import { RootState } from "../redux/store";
-import { clearMessages, setMessages } from "../redux/chatbot";
-import { api } from "../services/api";
+import { clearMessages, Message, setMessages, updateMessage } from "../redux/chatbot";
+import { api, streamQuery } from "../services/api";
 import Loader from "../common/Loader";
 import parseMarkdownToJSX from "../utils/parseMarkdownToJSX";
 import avatar from "../assets/chatbot.png";
@@ -73,36 +73,48 @@ const Messages = () => {
     }
     setMessageValue("");
     setLoading(true);
-    const payload = { question: sentMessage };
-    const url = `/query/`;
+
+    // The answer is drawn as it streams in: rows first, then the summary tokens
+    const messageId = `${Date.now()}`;
+    let started = false;
+    let summary = "";
+    let rows: string[] = [];
+    const showAnswer = (changes: Partial<Message>) => {
+      if (!started) {
+        started = true;
+        setLoading(false);
+        dispatch(
+          setMessages({
+            id: messageId,
+            text: "",
+            isUser: false,
+            timestamp: getCurrentTime(),
+            ...changes,
+          })
+        );
+      } else {
+        dispatch(updateMessage({ id: messageId, changes }));
+      }
+    };
 
     try {
-      const response = await api.post(url, payload, {
-        headers: {
-          "Content-Type": "application/json",
-        },
-        withCredentials: true,
+      await streamQuery(sentMessage, ({ event, data }) => {
+        if (event === "rows") {
+          rows = [...rows, ...(ReplaceEmptyWithNA(data) || [])];
+          showAnswer({ ambiguous_data: rows });
+        } else if (event === "summary") {
+          summary += data.text;
+          showAnswer({ text: parseMarkdownToJSX(summary) });
+        } else if (event === "error") {
+          showAnswer({ text: `Error: ${data.error}` });
+        }
       });
-      const botMessage = response.data.result;
-      const ambiguousData = ReplaceEmptyWithNA(response.data.data) || [];
-      const formattedBotMessage = parseMarkdownToJSX(botMessage);
-      dispatch(
-        setMessages({
-          text: formattedBotMessage,
-          isUser: false,
-          timestamp: getCurrentTime(),
-          ambiguous_data: ambiguousData,
-        })
-      );
+      if (!started) {
+        showAnswer({ text: "No matching records found." });
+      }
     } catch (err) {
       console.error("Error sending message:", err);
-      dispatch(
-        setMessages({
-          text: "Error: Could not send message",
-          isUser: false,
-          timestamp: getCurrentTime(),
-        })
-      );
+      showAnswer({ text: "Error: Could not send message" });
     } finally {
       setLoading(false);
     }
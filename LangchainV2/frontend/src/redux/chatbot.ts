@@ -1,7 +1,8 @@
 import { createSlice, PayloadAction } from "@reduxjs/toolkit";
 import { JSX } from "react";
 
-interface Message {
+export interface Message {
+  id?: string;
   text: string | JSX.Element;
   isUser: boolean;
   timestamp: string;
@@ -33,11 +34,20 @@ const chatbotSlice = createSlice({
     setTokenId: (state, action: PayloadAction<string>) => {
       state.tokenId = action.payload;
     },
+    updateMessage: (
+      state,
+      action: PayloadAction<{ id: string; changes: Partial<Message> }>
+    ) => {
+      const message = state.messages.find((msg) => msg.id === action.payload.id);
+      if (message) {
+        Object.assign(message, action.payload.changes);
+      }
+    },
     clearMessages: (state) => {
       state.messages = [];
     },
   },
 });
 
-export const { setTenantId, setMessages, clearMessages, setTokenId } = chatbotSlice.actions;
+export const { setTenantId, setMessages, updateMessage, clearMessages, setTokenId } = chatbotSlice.actions;
 export default chatbotSlice.reducer;
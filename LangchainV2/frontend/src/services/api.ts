@@ -16,4 +16,46 @@ axios.interceptors.response.use(function(response){
     return response;
 }, function(error){
     return Promise.reject(error);
-})
\ No newline at end of file
+})
+
+export type QueryStreamEvent = {
+    event: "prompt" | "sql" | "rows" | "summary" | "summary_path" | "done" | "error";
+    data: any;
+};
+
+// Reads the Server-Sent Events sent by /query/stream. EventSource only supports
+// GET, so the POST body is streamed through fetch and split into events here.
+export const streamQuery = async (
+    question: string,
+    onEvent: (event: QueryStreamEvent) => void
+) => {
+    const response = await fetch(`${ApiUrl}/query/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        credentials: "include",
+        body: JSON.stringify({ question }),
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`Stream request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = block.match(/^event: (.*)$/m)?.[1];
+            const data = block.match(/^data: (.*)$/m)?.[1];
+            if (event && data !== undefined) {
+                onEvent({ event: event as QueryStreamEvent["event"], data: JSON.parse(data) });
+            }
+            boundary = buffer.indexOf("\n\n");
+        }
+    }
+};